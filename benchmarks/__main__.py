@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+from benchmarks.run import main, parse_args
+
+if __name__ == '__main__':
+    main(parse_args())
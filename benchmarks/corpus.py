@@ -0,0 +1,145 @@
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+
+# Seconds between 1904-01-01 (QuickTime epoch) and 1970-01-01
+QUICKTIME_EPOCH = 2082844800
+
+
+class CorpusConfig(object):
+    """
+    Settings of a synthetic corpus. The same settings and seed always
+    generate the same files.
+    """
+
+    def __init__(self, files=1000, seed=1, video_ratio=0.1, no_date_ratio=0.05,
+                 duplicate_ratio=0.1, burst_ratio=0.1, sidecar_ratio=0.05,
+                 min_size=16 * 1024, max_size=256 * 1024, fan_out=4, depth=2,
+                 start='2015-01-01', days=3650):
+        self.files = files
+        self.seed = seed
+        self.video_ratio = video_ratio
+        self.no_date_ratio = no_date_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.burst_ratio = burst_ratio
+        self.sidecar_ratio = sidecar_ratio
+        self.min_size = min_size
+        self.max_size = max_size
+        self.fan_out = fan_out
+        self.depth = depth
+        self.start = start
+        self.days = days
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def build_ifd(tags, offset):
+    """Big-endian IFD with ASCII tags, the data follows the entries"""
+    entries = sorted(tags.items())
+    data_offset = offset + 2 + len(entries) * 12 + 4
+    table = b''
+    data = b''
+    for tag, value in entries:
+        value = value.encode() + b'\x00'
+        table += struct.pack('>HHII', tag, 2, len(value), data_offset + len(data))
+        data += value
+    return struct.pack('>H', len(entries)) + table + b'\x00\x00\x00\x00' + data
+
+
+def build_jpeg(date, padding):
+    """JPEG with an Exif DateTimeOriginal and CreateDate, padded to size"""
+    exif_ifd = {0x9003: date, 0x9004: date} if date else {}
+    ifd0 = struct.pack('>H', 1) + struct.pack('>HHII', 0x8769, 4, 1, 26) + b'\x00\x00\x00\x00'
+    tiff = b'MM\x00\x2a' + struct.pack('>I', 8) + ifd0 + build_ifd(exif_ifd, 26)
+    exif = b'Exif\x00\x00' + tiff
+    return b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif + \
+        b'\xff\xda\x00\x02' + padding + b'\xff\xd9'
+
+
+def box(kind, payload):
+    return struct.pack('>I', len(payload) + 8) + kind + payload
+
+
+def build_mp4(date, padding):
+    """MP4 with the creation date in the mvhd box, padded to size"""
+    created = 0
+    if date:
+        moment = datetime.strptime(date, '%Y:%m:%d %H:%M:%S')
+        created = int((moment - datetime(1970, 1, 1)).total_seconds()) + QUICKTIME_EPOCH
+    mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', created, created) + b'\x00' * 88)
+    return box(b'ftyp', b'isom\x00\x00\x02\x00isom') + box(b'mdat', padding) + box(b'moov', mvhd)
+
+
+def build_xmp(date):
+    return ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+            'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description '
+            f'xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmp:CreateDate="{date}"/>'
+            '</rdf:RDF></x:xmpmeta>').encode()
+
+
+def directories(root, config):
+    """All directories of the tree, fan_out subdirectories per level"""
+    paths = [root]
+    level = [root]
+    for depth in range(config.depth):
+        level = [os.path.join(parent, f'dir{depth}_{i}')
+                 for parent in level for i in range(config.fan_out)]
+        paths.extend(level)
+    return paths
+
+
+def generate(root, config):
+    """
+    Write the corpus to root and return a summary of the generated files
+    """
+    rng = random.Random(config.seed)
+    start = datetime.strptime(config.start, '%Y-%m-%d')
+    dirs = directories(root, config)
+    for directory in dirs:
+        os.makedirs(directory, exist_ok=True)
+
+    summary = {'files': 0, 'bytes': 0, 'videos': 0, 'no_date': 0,
+               'duplicates': 0, 'bursts': 0, 'sidecars': 0, 'directories': len(dirs)}
+    written = []
+    previous_date = None
+    for index in range(config.files):
+        directory = rng.choice(dirs)
+        if written and rng.random() < config.duplicate_ratio:
+            # Same content under another name, e.g. imported twice
+            extension, content = rng.choice(written)
+            summary['duplicates'] += 1
+            name = f'copy_{index:07d}{extension}'
+        else:
+            if previous_date and rng.random() < config.burst_ratio:
+                # Burst shots share the second, so their target names collide
+                date = previous_date
+                summary['bursts'] += 1
+            elif rng.random() < config.no_date_ratio:
+                date = None
+                summary['no_date'] += 1
+            else:
+                moment = start + timedelta(seconds=rng.randrange(config.days * 86400))
+                date = moment.strftime('%Y:%m:%d %H:%M:%S')
+            previous_date = date
+            padding = rng.getrandbits(8 * 64).to_bytes(64, 'big') * \
+                (rng.randint(config.min_size, config.max_size) // 64)
+            if rng.random() < config.video_ratio:
+                extension, content = '.mp4', build_mp4(date, padding)
+                summary['videos'] += 1
+            else:
+                extension, content = '.jpg', build_jpeg(date, padding)
+            written.append((extension, content))
+            name = f'IMG_{index:07d}{extension}'
+
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        summary['files'] += 1
+        summary['bytes'] += len(content)
+        if previous_date and rng.random() < config.sidecar_ratio:
+            with open(os.path.splitext(path)[0] + '.xmp', 'wb') as f:
+                f.write(build_xmp(previous_date))
+            summary['sidecars'] += 1
+    return summary
@@ -0,0 +1,178 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import CorpusConfig, generate
+from phockup import __version__
+from src.date import Date
+from src.exif import Exif
+from src.native import NativeExif
+from src.phockup import Phockup
+
+MODES = ('copy', 'move', 'link', 'dry-run')
+
+
+def exiftool_version():
+    if shutil.which('exiftool') is None:
+        return None
+    try:
+        return subprocess.check_output(['exiftool', '-ver']).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def media_files(root):
+    files = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        files.extend(os.path.join(directory, f) for f in sorted(filenames)
+                     if not f.endswith('.xmp'))
+    return files
+
+
+def result(name, count, seconds, **details):
+    return dict(name=name, files=count, seconds=round(seconds, 4),
+                files_per_second=round(count / seconds, 2) if seconds else None,
+                **details)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_exif(files):
+    results = []
+    if exiftool_version() is not None:
+        seconds = timed(lambda: [Exif(f).data() for f in files])
+        results.append(result('Exif.data', len(files), seconds))
+    seconds = timed(lambda: [NativeExif(f).data() for f in files])
+    results.append(result('NativeExif.data', len(files), seconds))
+    return results
+
+
+def bench_date(files, repeat):
+    samples = [(f, NativeExif(f).data()) for f in files]
+    samples = [(f, data) for f, data in samples if data]
+
+    def parse():
+        for _ in range(repeat):
+            for filename, data in samples:
+                Date(filename).from_exif(data)
+    return [result('Date.from_exif', len(samples) * repeat, timed(parse))]
+
+
+def bench_file_name_and_path(files, native_exif, workdir, repeat):
+    empty = os.path.join(workdir, 'empty')
+    os.makedirs(empty, exist_ok=True)
+    phockup = Phockup(empty, os.path.join(workdir, 'names'), dry_run=True,
+                      native_exif=native_exif)
+    seconds = timed(lambda: [phockup.get_file_name_and_path(f) for f in files])
+    results = [result('get_file_name_and_path', len(files), seconds, native_exif=native_exif)]
+    mimetypes = [(NativeExif(f).data() or {}).get('MIMEType', '') for f in files] * repeat
+    seconds = timed(lambda: [phockup.get_file_type(m) for m in mimetypes])
+    return results + [result('get_file_type', len(mimetypes), seconds)]
+
+
+def bench_runs(corpus, count, concurrency_levels, native_exif, workdir):
+    results = []
+    for mode in MODES:
+        for concurrency in concurrency_levels:
+            input_dir = os.path.join(workdir, 'input')
+            output_dir = os.path.join(workdir, 'output')
+            shutil.rmtree(output_dir, ignore_errors=True)
+            if mode == 'move':
+                # Moving consumes the input, so every run gets a fresh copy
+                shutil.rmtree(input_dir, ignore_errors=True)
+                shutil.copytree(corpus, input_dir)
+            else:
+                input_dir = corpus
+            options = dict(max_concurrency=concurrency, native_exif=native_exif,
+                           move=mode == 'move', link=mode == 'link', dry_run=mode == 'dry-run')
+            seconds = timed(lambda: Phockup(input_dir, output_dir, **options))
+            results.append(result('run', count, seconds, mode=mode, concurrency=concurrency,
+                                  native_exif=native_exif))
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def parse_args(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(
+        description="Benchmark phockup on a generated corpus and write the results as JSON")
+    defaults = CorpusConfig()
+    parser.add_argument('--files', type=int, default=defaults.files)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--video-ratio', type=float, default=defaults.video_ratio)
+    parser.add_argument('--no-date-ratio', type=float, default=defaults.no_date_ratio)
+    parser.add_argument('--duplicate-ratio', type=float, default=defaults.duplicate_ratio)
+    parser.add_argument('--burst-ratio', type=float, default=defaults.burst_ratio)
+    parser.add_argument('--sidecar-ratio', type=float, default=defaults.sidecar_ratio)
+    parser.add_argument('--min-size', type=int, default=defaults.min_size)
+    parser.add_argument('--max-size', type=int, default=defaults.max_size)
+    parser.add_argument('--fan-out', type=int, default=defaults.fan_out)
+    parser.add_argument('--depth', type=int, default=defaults.depth)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--native-exif', action='store_true',
+                        help="Read the dates without exiftool (always on if it is missing)")
+    parser.add_argument('--sample', type=int, default=200,
+                        help="Number of files for the micro benchmarks")
+    parser.add_argument('--workdir', help="Directory for the corpus, a temporary one by default")
+    parser.add_argument('--output', default='-', help="JSON file for the results, - for stdout")
+    return parser.parse_args(args)
+
+
+def main(options):
+    logger = logging.getLogger('phockup')
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    config = CorpusConfig(
+        files=options.files, seed=options.seed, video_ratio=options.video_ratio,
+        no_date_ratio=options.no_date_ratio, duplicate_ratio=options.duplicate_ratio,
+        burst_ratio=options.burst_ratio, sidecar_ratio=options.sidecar_ratio,
+        min_size=options.min_size, max_size=options.max_size,
+        fan_out=options.fan_out, depth=options.depth)
+    version = exiftool_version()
+    native_exif = options.native_exif or version is None
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='phockup-benchmark-')
+    try:
+        corpus = os.path.join(workdir, 'corpus')
+        shutil.rmtree(corpus, ignore_errors=True)
+        summary = generate(corpus, config)
+        files = media_files(corpus)
+        sample = files[:options.sample]
+
+        results = []
+        results += bench_exif(sample)
+        results += bench_date(sample, repeat=10)
+        results += bench_file_name_and_path(sample, native_exif, workdir, repeat=10)
+        results += bench_runs(corpus, len(files), options.concurrency, native_exif, workdir)
+    finally:
+        logger.setLevel(level)
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'phockup': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'exiftool': version,
+        'corpus': dict(config.as_dict(), **summary),
+        'results': results,
+    }
+    if options.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
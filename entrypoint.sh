@@ -1,7 +1,11 @@
 #!/usr/bin/env bash
 
+# If the WATCH variable is set, phockup keeps running and processes new files as they arrive
+if [ -n "$WATCH" ]; then
+  phockup /mnt/input /mnt/output --watch $OPTIONS
+
 # If the CRON variable is empty, phockup gets executed once as command line tool
-if [ -z "$CRON" ]; then
+elif [ -z "$CRON" ]; then
   phockup "$@"
 
 # When CRON is not empty, phockup will run in a cron job until the container is stopped.
@@ -6,9 +6,10 @@ import os
 import re
 import sys
 
-from src.date import Date
+from src.date import DATE_SOURCES, FILENAME_PATTERNS, Date, FilenameMatcher
 from src.dependency import check_dependencies
 from src.phockup import Phockup
+from src.transfer import COPY_METHODS
 
 __version__ = '1.13.0'
 
@@ -25,6 +26,24 @@ DEFAULT_DIR_FORMAT = ['%Y', '%m', '%d']
 logger = logging.getLogger('phockup')
 
 
+def filename_patterns(value):
+    try:
+        return FilenameMatcher(name.strip() for name in value.split(','))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def date_sources(value):
+    sources = [source.strip() for source in value.split(',')]
+    for source in sources:
+        if source not in DATE_SOURCES:
+            raise argparse.ArgumentTypeError(
+                f"Unknown date source '{source}', use one of {', '.join(DATE_SOURCES)}")
+    if len(set(sources)) != len(sources):
+        raise argparse.ArgumentTypeError(f"Date sources are listed twice in '{value}'")
+    return sources
+
+
 def parse_args(args=sys.argv[1:]):
     parser = argparse.ArgumentParser(
         description=PROGRAM_DESCRIPTION,
@@ -127,6 +146,26 @@ Example:
             """,
     )
 
+    parser.add_argument(
+        '--plan-out',
+        action='store',
+        metavar='PLAN',
+        help="""\
+            Write the decisions of a --dry-run to PLAN as JSON lines: every file with its date,
+            target and action. Review the plan and carry it out with --apply.
+            """,
+    )
+
+    parser.add_argument(
+        '--apply',
+        action='store',
+        metavar='PLAN',
+        help="""\
+            Carry out a plan written by --plan-out without extracting the metadata again.
+            Files whose size or modification time changed since are skipped.
+            """,
+    )
+
     parser.add_argument(
         '-c',
         '--max-concurrency',
@@ -140,6 +179,161 @@ Example:
             """,
     )
 
+    parser.add_argument(
+        '--exif-workers',
+        type=int,
+        choices=range(1, 255),
+        metavar='1-255',
+        help="""\
+            Sets the number of workers extracting the EXIF data of files.
+            Defaults to the value of --max-concurrency.
+            """,
+    )
+
+    parser.add_argument(
+        '--io-workers',
+        type=int,
+        choices=range(1, 255),
+        metavar='1-255',
+        help="""\
+            Sets the number of workers copying, moving or linking files.
+            Defaults to the value of --max-concurrency.
+            """,
+    )
+
+    parser.add_argument(
+        '--auto-concurrency',
+        action='store_true',
+        help="""\
+            Tune the number of workers while running to maximize the throughput.
+            The worker options become upper bounds and the chosen values are logged.
+            """,
+    )
+
+    parser.add_argument(
+        '--copy-method',
+        choices=COPY_METHODS,
+        default='auto',
+        help="""\
+            How files are copied. "reflink" shares the data copy-on-write (Btrfs, XFS),
+            "copy_file_range" and "sendfile" copy the data in the kernel and "userspace"
+            reads and writes it in phockup. "auto" tries them in this order and falls
+            back to the next one if a method is not supported. Defaults to auto.
+            """,
+    )
+
+    parser.add_argument(
+        '--exif-batch-size',
+        type=int,
+        default=0,
+        metavar='N',
+        help="""\
+            Extract the EXIF data of up to N files of a directory with a single exiftool
+            command instead of one command per file. Defaults to 0 (disabled).
+            """,
+    )
+
+    parser.add_argument(
+        '--native-exif',
+        action='store_true',
+        default=False,
+        help="""\
+            Read the dates of JPEG, HEIC and MP4/MOV files directly from their headers and only
+            use exiftool for other files or when the headers do not contain a date.
+            """,
+    )
+
+    parser.add_argument(
+        '--cache',
+        action='store',
+        metavar='PATH',
+        help="""\
+            Store the EXIF data and the parsed date of every file in a SQLite database at PATH.
+            Files which did not change since a previous run are not read with exiftool again.
+            """,
+    )
+
+    parser.add_argument(
+        '--cache-stats',
+        action='store_true',
+        default=False,
+        help="""\
+            Log a summary of the hits, misses and evictions of the --cache at the end of the run.
+            """,
+    )
+
+    parser.add_argument(
+        '--stats-json',
+        action='store',
+        metavar='PATH',
+        help="""\
+            Write the counters of the run and the timings of each stage (metadata extraction,
+            date parsing, duplicate checks, directory creation, copies and moves) to PATH as JSON.
+            """,
+    )
+
+    parser.add_argument(
+        '--metrics-file',
+        action='store',
+        metavar='PATH',
+        help="""\
+            Write the counters, the bytes transferred, the stage latencies and the duration of the
+            run to PATH in the Prometheus text format at the end of the run, e.g. for the textfile
+            collector of node_exporter. The file is replaced atomically.
+            """,
+    )
+
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=0,
+        metavar='SECONDS',
+        help="""\
+            Also write the --metrics-file every SECONDS while the run is in progress.
+            """,
+    )
+
+    parser.add_argument(
+        '--journal',
+        action='store',
+        metavar='PATH',
+        help="""\
+            Record the outcome of every file in a SQLite database at PATH. Files which
+            did not change since a previous run with the same options are skipped
+            without reading them with exiftool or looking at the output directory.
+            """,
+    )
+
+    parser.add_argument(
+        '--since-journal',
+        action='store_true',
+        default=False,
+        help="""\
+            Also skip the directories whose files were not added, removed or renamed
+            since the last completed run, using their modification time. Requires --journal.
+            """,
+    )
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help="""\
+            Continue an interrupted run where it stopped, using the checkpoint it saved in
+            the output directory, instead of processing all files again.
+            """,
+    )
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        default=False,
+        help="""\
+            Keep running after processing the input directory and process the files
+            written or moved into it as soon as they stop growing (Linux only).
+            """,
+    )
+
     parser.add_argument(
         '--maxdepth',
         type=int,
@@ -167,6 +361,34 @@ Example:
             """,
     )
 
+    parser.add_argument(
+        '--filename-patterns',
+        action='store',
+        type=filename_patterns,
+        metavar='NAMES',
+        help=f"""\
+            Comma separated list of the built-in file name patterns to extract the date from
+            if there is no EXIF date information and no --regex, tried in the given order.
+            Defaults to all of them: {','.join(FILENAME_PATTERNS)}.
+            """,
+    )
+
+    parser.add_argument(
+        '--date-source-order',
+        action='store',
+        type=date_sources,
+        metavar='SOURCES',
+        help="""\
+            Comma separated list of the sources to take the date from, in order: exif,
+            filename (--regex or --filename-patterns) and mtime (the modification time).
+            With filename before exif, photos and videos with a date in their name and a
+            known extension are not read with exiftool at all.
+
+            Example:
+                --date-source-order=filename,exif,mtime
+            """,
+    )
+
     parser.add_argument(
         '-f',
         '--date-field',
@@ -287,6 +509,17 @@ Example:
             """,
     )
 
+    parser.add_argument(
+        '--dedupe-content',
+        action='store_true',
+        default=False,
+        help="""\
+            Skip files whose content already exists anywhere in the OUTPUTDIR, even under a
+            different name or date directory. Without this option only a file with the same
+            target name is compared.
+            """,
+    )
+
     parser.add_argument(
         '--rmdirs',
         action='store_true',
@@ -375,18 +608,38 @@ def main(options):
         move=options.move,
         link=options.link,
         date_regex=options.regex,
+        filename_matcher=options.filename_patterns,
+        date_source_order=options.date_source_order,
         original_filenames=options.original_names,
         timestamp=options.timestamp,
         date_field=options.date_field,
         dry_run=options.dry_run,
+        plan_out=options.plan_out,
+        apply=options.apply,
         quiet=options.quiet,
         progress=options.progress,
         max_depth=options.maxdepth,
         file_type=options.file_type,
         max_concurrency=options.max_concurrency,
+        exif_workers=options.exif_workers,
+        io_workers=options.io_workers,
+        auto_concurrency=options.auto_concurrency,
+        copy_method=options.copy_method,
+        exif_batch_size=options.exif_batch_size,
+        native_exif=options.native_exif,
+        cache=options.cache,
+        cache_stats=options.cache_stats,
+        stats_json=options.stats_json,
+        metrics_file=options.metrics_file,
+        metrics_interval=options.metrics_interval,
+        journal=options.journal,
+        since_journal=options.since_journal,
+        resume=options.resume,
+        watch=options.watch,
         no_date_dir=options.no_date_dir,
         skip_unknown=options.skip_unknown,
         movedel=options.movedel,
+        dedupe_content=options.dedupe_content,
         rmdirs=options.rmdirs,
         output_prefix=options.output_prefix,
         output_suffix=options.output_suffix,
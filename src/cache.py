@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+
+class MetadataCache(object):
+    """
+    On-disk cache of the exiftool data and the parsed date of files.
+    Entries are keyed by the path, size, modification time and inode of
+    the file, so a changed file is never served from the cache.
+    """
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.lock = threading.Lock()
+        self.run_id = time.time()
+        self.pending = 0
+        self.seen = []
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        try:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS metadata (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    exif TEXT,
+                    date_options TEXT,
+                    date TEXT,
+                    seen REAL NOT NULL
+                )""")
+            self.connection.commit()
+        except sqlite3.Error as e:
+            raise OSError(f"Cannot open metadata cache '{self.path}': {e}")
+
+    @staticmethod
+    def identity(filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def get(self, filename):
+        """
+        Return the cached entry of an unchanged file as a dict with the keys
+        'exif', 'date_options' and 'date', or None if there is no such entry.
+        """
+        identity = self.identity(filename)
+        path = os.path.abspath(filename)
+        with self.lock:
+            row = None
+            if identity is not None:
+                row = self.connection.execute(
+                    'SELECT size, mtime_ns, inode, exif, date_options, date '
+                    'FROM metadata WHERE path = ?', (path,)).fetchone()
+            if row is None or tuple(row[:3]) != identity:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.seen.append(path)
+            if len(self.seen) >= self.COMMIT_INTERVAL:
+                self._commit()
+        return {
+            'exif': json.loads(row[3]) if row[3] is not None else None,
+            'date_options': row[4],
+            'date': self.decode_date(row[5]) if row[4] is not None else None,
+        }
+
+    def contains(self, filename):
+        identity = self.identity(filename)
+        if identity is None:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime_ns, inode FROM metadata WHERE path = ?',
+                (os.path.abspath(filename),)).fetchone()
+        return row is not None and tuple(row) == identity
+
+    def put(self, filename, exif, date_options=None, date=None):
+        identity = self.identity(filename)
+        if identity is None:
+            return
+        values = (os.path.abspath(filename), *identity,
+                  json.dumps(exif) if exif is not None else None,
+                  date_options,
+                  self.encode_date(date) if date_options is not None else None,
+                  self.run_id)
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO metadata '
+                '(path, size, mtime_ns, inode, exif, date_options, date, seen) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', values)
+            self.stored += 1
+            self.pending += 1
+            if self.pending >= self.COMMIT_INTERVAL:
+                self._commit()
+
+    def evict(self, root):
+        """
+        Remove the entries below root which were not used during this run,
+        because the file was deleted, moved or is no longer processed.
+        """
+        root = os.path.join(os.path.abspath(root), '')
+        with self.lock:
+            self._commit()
+            cursor = self.connection.execute(
+                'DELETE FROM metadata WHERE substr(path, 1, ?) = ? AND seen < ?',
+                (len(root), root, self.run_id))
+            self.evicted += cursor.rowcount
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            self._commit()
+            entries = self.connection.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stored': self.stored,
+            'evicted': self.evicted,
+            'entries': entries,
+        }
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        if self.seen:
+            self.connection.executemany(
+                'UPDATE metadata SET seen = ? WHERE path = ?',
+                [(self.run_id, path) for path in self.seen])
+            self.seen = []
+        self.connection.commit()
+        self.pending = 0
+
+    @staticmethod
+    def encode_date(date):
+        if date is None:
+            return json.dumps(None)
+        return json.dumps({
+            'date': date['date'].isoformat() if date.get('date') else None,
+            'subseconds': date.get('subseconds', ''),
+        })
+
+    @staticmethod
+    def decode_date(value):
+        date = json.loads(value)
+        if date is None:
+            return None
+        if date['date'] is not None:
+            date['date'] = datetime.fromisoformat(date['date'])
+        return date
@@ -0,0 +1,236 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from src.transfer import TEMP_SUFFIX
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger('phockup')
+
+# Checkpoints and their lock files are named after this prefix
+PREFIX = '.phockup-checkpoint'
+
+
+def try_lock(f):
+    """
+    Lock an open file exclusively without waiting. Returns False if another
+    open file holds the lock.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class Checkpoint(object):
+    """
+    Progress of a run, saved regularly to a JSON file in the output
+    directory so an interrupted run can be resumed. A directory is done
+    once all its files are handled; until then its handled files are
+    listed. Paths are stored relative to the input directory.
+
+    Every input directory has its own checkpoint, and the running run holds
+    a lock on a file next to it, so runs from several inputs into the same
+    output directory keep apart.
+    """
+    INTERVAL = 10.0
+
+    def __init__(self, output_dir, input_dir, enabled=True):
+        self.input_dir = os.path.abspath(input_dir)
+        name = hashlib.sha1(os.fsencode(self.input_dir)).hexdigest()[:16]
+        self.path = os.path.join(output_dir, f'{PREFIX}-{name}.json')
+        self.lock_path = os.path.join(output_dir, f'{PREFIX}-{name}.lock')
+        self.lock_file = None
+        self.enabled = enabled
+        # Files are not tracked while watching, only the run is marked
+        self.tracking = True
+        self.lock = threading.Lock()
+        self.done_dirs = set()
+        self.done_files = {}
+        self.remaining = {}
+        self.dirty = False
+        self.saved = time.monotonic()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def acquire(self):
+        """
+        Lock the checkpoint for this run. Returns False if another run from
+        the same input directory holds it.
+        """
+        if not self.enabled:
+            return True
+        try:
+            f = open(self.lock_path, 'a')
+        except OSError as e:
+            logger.warning(f"Cannot lock checkpoint '{self.path}': {e}")
+            return True
+        if not try_lock(f):
+            f.close()
+            return False
+        self.lock_file = f
+        return True
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    @staticmethod
+    def others_running(output_dir, own=None):
+        """
+        Whether a run other than the one holding own writes to output_dir
+        """
+        for path in glob.glob(os.path.join(glob.escape(output_dir), f'{PREFIX}-*.lock')):
+            if path == own:
+                continue
+            try:
+                f = open(path, 'a')
+            except OSError:
+                continue
+            with f:
+                if not try_lock(f):
+                    return True
+        return False
+
+    def load(self):
+        """
+        Load the progress of the previous run on the same input directory.
+        Returns False if there is none.
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('input_dir') != self.input_dir:
+            return False
+        self.done_dirs = set(state['done_dirs'])
+        self.done_files = {d: set(names) for d, names in state['done_files'].items()}
+        return True
+
+    def relative(self, directory):
+        return os.path.relpath(os.path.abspath(directory), self.input_dir)
+
+    def pending(self, directory, file_paths):
+        """
+        Return the files of a directory which were not handled yet and
+        expect them to be handled, except the xmp files
+        """
+        key = self.relative(directory)
+        with self.lock:
+            if key in self.done_dirs:
+                return [f for f in file_paths if f.endswith('.xmp')]
+            done = self.done_files.get(key, ())
+            file_paths = [f for f in file_paths
+                          if f.endswith('.xmp') or os.path.basename(f) not in done]
+            count = sum(1 for f in file_paths if not f.endswith('.xmp'))
+            if count:
+                self.remaining[key] = count
+            else:
+                self.finish(key)
+        return file_paths
+
+    def done(self, filename):
+        if not self.tracking:
+            return
+        directory, name = os.path.split(filename)
+        key = self.relative(directory)
+        with self.lock:
+            self.done_files.setdefault(key, set()).add(name)
+            self.dirty = True
+            if key in self.remaining:
+                self.remaining[key] -= 1
+                if self.remaining[key] <= 0:
+                    del self.remaining[key]
+                    self.finish(key)
+            if time.monotonic() - self.saved >= self.INTERVAL:
+                self._save()
+
+    def finish(self, key):
+        self.done_dirs.add(key)
+        self.done_files.pop(key, None)
+        self.dirty = True
+
+    def start(self):
+        """
+        Save the checkpoint right away, so a run which ends before the
+        first regular save is still noticed and cleaned up after
+        """
+        with self.lock:
+            self.dirty = True
+            self._save()
+
+    def watch(self):
+        """
+        Stop tracking the files, which would grow the checkpoint with every
+        file ever watched. It only marks the run as in progress from now on.
+        """
+        with self.lock:
+            self.tracking = False
+            self.done_dirs = set()
+            self.done_files = {}
+            self.remaining = {}
+            self.dirty = True
+            self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        self.saved = time.monotonic()
+        if not self.enabled or not self.dirty:
+            return
+        state = {
+            'input_dir': self.input_dir,
+            'done_dirs': sorted(self.done_dirs),
+            'done_files': {d: sorted(names) for d, names in self.done_files.items()},
+        }
+        # Write a new file and rename it, so a crash never leaves half of it
+        temp = self.path + TEMP_SUFFIX
+        try:
+            with open(temp, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Cannot save checkpoint '{self.path}': {e}")
+
+    def remove(self):
+        if self.enabled and self.exists():
+            os.remove(self.path)
+        if self.lock_file is not None:
+            os.remove(self.lock_path)
+            self.release()
+
+    @staticmethod
+    def remove_temp_files(output_dir):
+        """
+        Remove the files left behind by copies or moves of a crashed run
+        """
+        for root, dirnames, files in os.walk(output_dir):
+            for filename in files:
+                if filename.endswith(TEMP_SUFFIX):
+                    path = os.path.join(root, filename)
+                    logger.info(f"Removing unfinished file {path}")
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning(f"Cannot remove unfinished file {path}: {e}")
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('phockup')
+
+
+class AdaptiveLimiter(object):
+    """
+    Limits the number of tasks running at once and tunes the limit while
+    running. After every window the throughput is compared with the
+    previous window: the limit keeps moving in the same direction while
+    the throughput improves and turns around when it drops (hill
+    climbing). When more workers only add latency, the limit is halved.
+    """
+    DEFAULT_MAXIMUM = 32
+    WINDOW = 2.0
+    MIN_SAMPLES = 8
+    TOLERANCE = 0.05
+    LATENCY_LIMIT = 2.0
+
+    def __init__(self, name, maximum, initial=1, clock=time.monotonic):
+        self.name = name
+        self.maximum = maximum
+        self.limit = min(initial, maximum)
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.active = 0
+        self.direction = 1
+        self.previous = None
+        self.best = (0.0, self.limit)
+        self.lowest_latency = None
+        self.reset(clock())
+
+    def reset(self, now):
+        self.window_start = now
+        self.completed = 0
+        self.busy = 0.0
+
+    def run(self, function, item, size=1):
+        """
+        Call function(item) once a slot is free. size is the number of
+        files the item stands for.
+        """
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        start = self.clock()
+        try:
+            return function(item)
+        finally:
+            end = self.clock()
+            with self.condition:
+                self.active -= 1
+                self.record(end - start, end, size)
+                self.condition.notify_all()
+
+    def record(self, duration, now, size=1):
+        self.completed += size
+        self.busy += duration
+        elapsed = now - self.window_start
+        if elapsed >= self.WINDOW and self.completed >= self.MIN_SAMPLES:
+            self.adjust(self.completed / elapsed, self.busy / self.completed)
+            self.reset(now)
+
+    def adjust(self, throughput, latency):
+        if throughput > self.best[0]:
+            self.best = (throughput, self.limit)
+        if self.lowest_latency is None or latency < self.lowest_latency:
+            self.lowest_latency = latency
+
+        gain = throughput / self.previous if self.previous else None
+        limit = self.limit
+        if gain is not None and gain < 1 + self.TOLERANCE \
+                and latency > self.lowest_latency * self.LATENCY_LIMIT:
+            # More workers only queue up behind each other
+            limit = max(1, limit // 2)
+            self.direction = 1
+        else:
+            if gain is not None and gain < 1 - self.TOLERANCE:
+                self.direction = -self.direction
+            limit = min(self.maximum, max(1, limit + self.direction))
+            if limit == self.limit:
+                self.direction = -self.direction
+        self.previous = throughput
+
+        if limit != self.limit:
+            logger.debug(f"Auto concurrency: {self.name} workers {self.limit} => {limit} "
+                         f"({throughput:.1f} files/second, {latency * 1000:.0f} ms/file)")
+            self.limit = limit
+
+    @property
+    def chosen(self):
+        """
+        The limit with the highest throughput so far
+        """
+        return self.best[1]
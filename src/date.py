@@ -2,8 +2,80 @@ import os
 import re
 from datetime import datetime, timedelta
 
+# The shapes exiftool writes dates in, optionally followed by a time zone
+EXIF_DATE = re.compile(r'(\d{4})([:-])(\d{2})\2(\d{2}) (\d{2}):(\d{2}):(\d{2})(?:[+-]\d{2}:\d{2})?')
+TIME_ZONE = re.compile(r'(.*)([+-]\d{2}:\d{2})')
+SUBSECONDS_TIME_ZONE = re.compile(r'(\d*)[+-]\d{2}:\d{2}')
+
+# Dates in file names, tried in this order. Every pattern may match anywhere
+# in the name and uses the year, month, day, hour, minute and second groups;
+# missing time groups are midnight.
+FILENAME_PATTERNS = {
+    # IMG_20160915_123456.jpg, PXL_20230101_123456789.jpg, Screenshot_20230101-123456.png
+    'default': r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})',
+    # 20230101_123456.jpg, 20230101_123456(1).mp4
+    'samsung': r'.*?(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})_(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})',
+    # IMG-20230101-WA0001.jpg, WhatsApp Image 2023-01-01 at 12.34.56.jpeg
+    'whatsapp': r'.*?(?:(?:IMG|VID|AUD|PTT|STK)-(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})-WA\d+'
+                r'|WhatsApp (?:Image|Video) (?P<year2>\d{4})-(?P<month2>\d{2})-(?P<day2>\d{2}) at '
+                r'(?P<hour2>\d{2})\.(?P<minute2>\d{2})\.(?P<second2>\d{2}))',
+    # signal-2023-01-01-123456.jpg, signal-2023-01-01-12-34-56-789.jpg
+    'signal': r'.*?signal-(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})-(?P<hour>\d{2})-?(?P<minute>\d{2})-?(?P<second>\d{2})',
+    # Screenshot 2023-01-01 at 12.34.56.png, Screenshot_2023-01-01-12-34-56-789_app.jpg
+    'screenshot': r'.*?Screen ?[Ss]hot[ _](?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})(?: at)?[ _-]'
+                  r'(?P<hour>\d{2})[.-]?(?P<minute>\d{2})[.-]?(?P<second>\d{2})',
+    # Scan_20230101.jpg, scan 2023-01-01 12-34-56.pdf
+    'scanner': r'.*?[Ss]can(?:ned)?[ _-]?(?P<year>\d{4})-?(?P<month>\d{2})-?(?P<day>\d{2})'
+               r'(?:[ _-](?P<hour>\d{2})[.-]?(?P<minute>\d{2})[.-]?(?P<second>\d{2}))?',
+}
+FILENAME_GROUPS = ('year', 'month', 'day', 'hour', 'minute', 'second')
+DATE_SOURCES = ('exif', 'filename', 'mtime')
+
+
+class FilenameMatcher:
+    """
+    Matches file names against several FILENAME_PATTERNS in a single pass.
+    The patterns are compiled into one alternation whose groups are
+    prefixed with the index of the pattern, the alternative which matched
+    is the last group of the match.
+    """
+
+    def __init__(self, names=None):
+        self.names = list(FILENAME_PATTERNS) if names is None else list(names)
+        for name in self.names:
+            if name not in FILENAME_PATTERNS:
+                raise ValueError(f"Unknown file name pattern '{name}', "
+                                 f"use one of {', '.join(FILENAME_PATTERNS)}")
+        alternatives = []
+        for index, name in enumerate(self.names):
+            pattern = re.sub(r'\(\?P<(\w+)>', f'(?P<p{index}_\\1>', FILENAME_PATTERNS[name])
+            alternatives.append(f'(?P<p{index}>{pattern})')
+        self.regex = re.compile('|'.join(alternatives))
+
+    def match(self, filename):
+        """
+        Return the date groups of the first pattern matching the file name,
+        '0' for the missing ones, or None
+        """
+        matches = self.regex.search(filename)
+        if matches is None:
+            return None
+        prefix = f'{matches.lastgroup}_'
+        groups = {}
+        for key, value in matches.groupdict().items():
+            if value is not None and key.startswith(prefix):
+                # Alternatives of one pattern number their groups
+                groups[key[len(prefix):].rstrip('0123456789')] = value
+        return {group: groups.get(group, '0') for group in FILENAME_GROUPS}
+
+
+DEFAULT_FILENAME_MATCHER = FilenameMatcher()
+
 
 class Date:
+    DEFAULT_FIELDS = ['SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate',
+                      'DateTimeOriginal']
+
     def __init__(self, filename=None):
         self.filename = filename
 
@@ -34,12 +106,12 @@ class Date:
             date_object['minute'] if date_object.get('minute') else 0,
             date_object['second'] if date_object.get('second') else 0)
 
-    def from_exif(self, exif, timestamp=None, user_regex=None, date_field=None):
+    def from_exif(self, exif, timestamp=None, user_regex=None, date_field=None,
+                  filename_matcher=None):
         if date_field:
             keys = date_field.split()
         else:
-            keys = ['SubSecCreateDate', 'SubSecDateTimeOriginal', 'CreateDate',
-                    'DateTimeOriginal']
+            keys = Date.DEFAULT_FIELDS
 
         datestr = None
 
@@ -68,46 +140,54 @@ class Date:
             return parsed_date
         else:
             if self.filename:
-                return self.from_filename(user_regex, timestamp)
+                return self.from_filename(user_regex, timestamp, filename_matcher)
             else:
                 return parsed_date
 
     @staticmethod
     def from_datestring(datestr) -> dict:
-        datestr = datestr.split('.')
-        date = datestr[0]
-        if len(datestr) > 1:
-            subseconds = datestr[1]
-        else:
-            subseconds = ''
-        search = r'(.*)([+-]\d{2}:\d{2})'
-        if re.search(search, date) is not None:
-            date = re.sub(search, r'\1', date)
-        try:
-            parsed_date_time = Date.strptime(date, '%Y:%m:%d %H:%M:%S')
-        except ValueError:
+        date, _, subseconds = datestr.partition('.')
+        subseconds = subseconds.partition('.')[0]
+        matches = EXIF_DATE.fullmatch(date)
+        if matches is not None:
+            # Fast path for the usual shapes, strptime would accept the same
+            year, _, month, day, hour, minute, second = matches.groups()
             try:
-                parsed_date_time = Date.strptime(date, '%Y-%m-%d %H:%M:%S')
+                parsed_date_time = datetime(int(year), int(month), int(day),
+                                            int(hour), int(minute), int(second))
             except ValueError:
                 parsed_date_time = None
-        if re.search(search, subseconds) is not None:
-            subseconds = re.sub(search, r'\1', subseconds)
+        else:
+            date = TIME_ZONE.sub(r'\1', date)
+            try:
+                parsed_date_time = Date.strptime(date, '%Y:%m:%d %H:%M:%S')
+            except ValueError:
+                try:
+                    parsed_date_time = Date.strptime(date, '%Y-%m-%d %H:%M:%S')
+                except ValueError:
+                    parsed_date_time = None
+        if '+' in subseconds or '-' in subseconds:
+            matches = SUBSECONDS_TIME_ZONE.fullmatch(subseconds)
+            subseconds = matches.group(1) if matches is not None \
+                else TIME_ZONE.sub(r'\1', subseconds)
         return {
             'date': parsed_date_time,
             'subseconds': subseconds
         }
 
-    def from_filename(self, user_regex, timestamp=None):
+    def from_filename(self, user_regex, timestamp=None, filename_matcher=None):
         # If missing datetime from EXIF data check if filename is in datetime
         # format. For this use a user provided regex if possible. Otherwise
-        # assume a filename such as IMG_20160915_123456.jpg as default.
-        default_regex = re.compile(r'.*[_-](?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})[_-]?(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})')
-        regex = user_regex or default_regex
-        matches = regex.search(os.path.basename(self.filename))
+        # try the FILENAME_PATTERNS, such as IMG_20160915_123456.jpg.
+        basename = os.path.basename(self.filename)
+        if user_regex:
+            matches = user_regex.search(basename)
+            match_dir = matches.groupdict(default='0') if matches else None
+        else:
+            match_dir = (filename_matcher or DEFAULT_FILENAME_MATCHER).match(basename)
 
-        if matches:
+        if match_dir:
             try:
-                match_dir = matches.groupdict(default='0')
                 # Convert str to int
                 match_dir = dict([a, int(x)] for a, x in match_dir.items())
                 date = self.build(match_dir)
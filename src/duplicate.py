@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+
+from src.checkpoint import PREFIX
+from src.transfer import TEMP_SUFFIX
+
+
+class FileHasher(object):
+    """
+    Compares and hashes file contents. The digests of every file are
+    remembered for the whole run, so each file is read at most once.
+    """
+    BLOCK_SIZE = 1024 * 1024
+    PARTIAL_SIZE = 64 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.partial_digests = {}
+
+    def same(self, first, second):
+        """
+        Compare the content of two files in stages: the size, a hash of the
+        first and last blocks and only then a hash of the full content.
+        """
+        if os.path.getsize(first) != os.path.getsize(second):
+            return False
+        if self.partial_digest(first) != self.partial_digest(second):
+            return False
+        return self.digest(first) == self.digest(second)
+
+    def digest(self, filename):
+        return self.memoized(self.digests, filename, self.hash_file)
+
+    def partial_digest(self, filename):
+        return self.memoized(self.partial_digests, filename, self.hash_ends)
+
+    def memoized(self, digests, filename, function):
+        stat = os.stat(filename)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            known = digests.get(filename)
+        if known is not None and known[0] == key:
+            return known[1]
+        digest = function(filename, stat.st_size)
+        with self.lock:
+            digests[filename] = (key, digest)
+        return digest
+
+    def carry(self, source, target, forget=False):
+        """
+        Remember the known digests of source for target, a copy, link or
+        move of it, so target is never read to hash it. They only carry over
+        if target has the same size and modification time. With forget, the
+        digests of source are dropped, e.g. after it was moved.
+        """
+        try:
+            stat = os.stat(target)
+        except OSError:
+            return
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            for digests in (self.digests, self.partial_digests):
+                known = digests.pop(source, None) if forget else digests.get(source)
+                if known is not None and known[0] == key:
+                    digests[target] = known
+
+    def hash_file(self, filename, size):
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(self.BLOCK_SIZE), b''):
+                sha.update(block)
+        return sha.digest()
+
+    def hash_ends(self, filename, size):
+        if size <= 2 * self.PARTIAL_SIZE:
+            # Small files are read completely anyway
+            return self.digest(filename)
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            sha.update(f.read(self.PARTIAL_SIZE))
+            f.seek(-self.PARTIAL_SIZE, os.SEEK_END)
+            sha.update(f.read(self.PARTIAL_SIZE))
+        return sha.digest()
+
+
+class ContentIndex(object):
+    """
+    Index of the files in the output directory by size and content hash.
+    The directory is listed on first use only, and the files are compared
+    only when a source file of the same size is looked up.
+    """
+
+    def __init__(self, root, hasher):
+        self.root = root
+        self.hasher = hasher
+        self.lock = threading.Lock()
+        self.sizes = None
+
+    def build(self):
+        sizes = {}
+        for root, dirnames, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(('.xmp', TEMP_SUFFIX)) or filename.startswith(PREFIX):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                sizes.setdefault(size, []).append((path, path))
+        return sizes
+
+    def find(self, filename):
+        """
+        Return the path of a file in the output directory with the same
+        content as filename, or None
+        """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return None
+        with self.lock:
+            if self.sizes is None:
+                self.sizes = self.build()
+            candidates = list(self.sizes.get(size, ()))
+        if not candidates:
+            return None
+
+        for path, content in candidates:
+            try:
+                if self.hasher.same(filename, content):
+                    return path
+            except OSError:
+                continue
+        return None
+
+    def add(self, path, size, content=None):
+        """
+        Add a written file. content is the file to compare with instead of
+        path, e.g. the source when nothing was written during a dry run.
+        """
+        with self.lock:
+            if self.sizes is None:
+                self.sizes = self.build()
+            self.sizes.setdefault(size, []).append((path, content or path))
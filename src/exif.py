@@ -1,16 +1,26 @@
 import json
+import logging
+import os
+import queue
 import shlex
 import subprocess
 import sys
 import threading
 from subprocess import CalledProcessError, check_output
 
+logger = logging.getLogger('phockup')
+
 
 class Exif(object):
-    def __init__(self, filename):
+    ARGS = ('-time:all', '-mimetype', '-j')
+
+    def __init__(self, filename, pool=None):
         self.filename = filename
+        self.pool = pool
 
     def data(self):
+        if self.pool is not None:
+            return self.pool.data(self.filename)
         try:
             exif_command = self.get_exif_command(self.filename)
             if threading.current_thread() is threading.main_thread():
@@ -30,3 +40,206 @@ class Exif(object):
         if sys.platform == 'win32':
             return f'exiftool -time:all -mimetype -j "{filename}"'
         return f'exiftool -time:all -mimetype -j {shlex.quote(filename)}'
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifToolTimeout(ExifToolError):
+    pass
+
+
+class ExifTool(object):
+    """
+    A single long-lived `exiftool -stay_open True -@ -` process.
+    Commands are written to its stdin and the output is read back
+    until the `{readyN}` marker of that command.
+    """
+    DEFAULT_TIMEOUT = 60
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.process = None
+        self.lines = None
+        self.counter = 0
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if threading.current_thread() is threading.main_thread():
+            stderr = None
+        else:
+            # Swallow stderr in the case that multiple threads are executing
+            stderr = subprocess.DEVNULL
+        try:
+            self.process = subprocess.Popen(
+                ['exiftool', '-stay_open', 'True', '-@', '-'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+        except OSError as e:
+            raise ExifToolError(f'Cannot start exiftool: {e}')
+        self.lines = queue.Queue()
+        # A reader thread lets us wait for the output with a timeout on
+        # every platform, so a hanging exiftool can be detected and killed.
+        reader = threading.Thread(target=self._read, args=(self.process.stdout, self.lines),
+                                  daemon=True)
+        reader.start()
+
+    @staticmethod
+    def _read(stdout, lines):
+        for line in iter(stdout.readline, b''):
+            lines.put(line)
+        lines.put(None)
+
+    def execute(self, *args, timeout=None):
+        """
+        Run a command and return its output. timeout replaces the timeout
+        of the process for commands on many files.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self.running():
+            self.start()
+        self.counter += 1
+        ready = f'{{ready{self.counter}}}'.encode()
+        command = list(args)
+        if sys.platform == 'win32':
+            command = ['-charset', 'filename=utf8'] + command
+        command.append(f'-execute{self.counter}')
+        try:
+            # Names which are not valid UTF-8 are passed on as their raw bytes
+            self.process.stdin.write(b'\n'.join(os.fsencode(arg) for arg in command) + b'\n')
+            self.process.stdin.flush()
+        except OSError as e:
+            self.stop()
+            raise ExifToolError(f'exiftool is not accepting commands: {e}')
+
+        output = []
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                self.stop(kill=True)
+                raise ExifToolTimeout(f'exiftool did not respond within {timeout} seconds')
+            if line is None:
+                self.stop()
+                raise ExifToolError('exiftool exited unexpectedly')
+            if line.rstrip() == ready:
+                return b''.join(output)
+            output.append(line)
+
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            if kill:
+                process.kill()
+                process.wait()
+            elif process.poll() is None:
+                process.stdin.write(b'-stay_open\nFalse\n')
+                process.stdin.flush()
+                process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            for stream in (process.stdin, process.stdout):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+
+class ExifToolPool(object):
+    """
+    Pool of persistent exiftool processes. Every thread that asks for data
+    checks out an idle process (or starts a new one), so there is at most
+    one process per concurrently running worker.
+    """
+
+    def __init__(self, timeout=ExifTool.DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = []
+        self.processes = []
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            exiftool = ExifTool(self.timeout)
+            self.processes.append(exiftool)
+            return exiftool
+
+    def release(self, exiftool):
+        with self.lock:
+            if exiftool in self.processes:
+                self.idle.append(exiftool)
+                return
+        # The pool was closed while the process was checked out
+        exiftool.stop()
+
+    def execute(self, *args, timeout=None):
+        """
+        Run a command on a pooled process. A crashed process is restarted
+        and the command retried once, a hanging one is killed and restarted
+        on the next command.
+        """
+        exiftool = self.acquire()
+        try:
+            try:
+                return exiftool.execute(*args, timeout=timeout)
+            except ExifToolTimeout:
+                raise
+            except ExifToolError as e:
+                logger.debug(f'Restarting exiftool: {e}')
+                return exiftool.execute(*args, timeout=timeout)
+        finally:
+            self.release(exiftool)
+
+    def data(self, filename):
+        if '\n' in filename or '\r' in filename:
+            # Arguments are newline separated, fall back to a one-off process
+            return Exif(filename).data()
+        try:
+            output = self.execute(*Exif.ARGS, filename)
+            return json.loads(output.decode('UTF-8', 'surrogateescape'))[0]
+        except (ExifToolError, UnicodeDecodeError, ValueError, IndexError):
+            return None
+
+    def batch_data(self, filenames):
+        """
+        Extract the data of many files with a single exiftool command.
+        Returns a dict of filename to data. Files exiftool could not read
+        are missing from the result.
+        """
+        filenames = [f for f in filenames if '\n' not in f and '\r' not in f]
+        if not filenames:
+            return {}
+        try:
+            # Each file of the batch gets the time a single file would
+            output = self.execute(*Exif.ARGS, *filenames,
+                                  timeout=self.timeout * len(filenames))
+            items = json.loads(output.decode('UTF-8', 'surrogateescape'))
+        except (ExifToolError, UnicodeDecodeError, ValueError):
+            return {}
+
+        # exiftool reports every file as SourceFile, possibly with
+        # normalized separators, so map it back to the path we asked for
+        requested = {os.path.normpath(f): f for f in filenames}
+        result = {}
+        for item in items:
+            source = item.get('SourceFile')
+            if source is None:
+                continue
+            filename = requested.get(os.path.normpath(source))
+            if filename is not None:
+                result[filename] = item
+        return result
+
+    def close(self):
+        with self.lock:
+            processes, self.processes, self.idle = self.processes, [], []
+        for exiftool in processes:
+            exiftool.stop()
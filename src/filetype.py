@@ -0,0 +1,140 @@
+import os
+
+# The MIME types exiftool reports for the usual photo and video extensions
+EXTENSION_MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+    '.heic': 'image/heic',
+    '.heif': 'image/heif',
+    '.tif': 'image/tiff',
+    '.tiff': 'image/tiff',
+    '.dng': 'image/x-adobe-dng',
+    '.cr2': 'image/x-canon-cr2',
+    '.cr3': 'image/x-canon-cr3',
+    '.nef': 'image/x-nikon-nef',
+    '.arw': 'image/x-sony-arw',
+    '.orf': 'image/x-olympus-orf',
+    '.rw2': 'image/x-panasonic-rw2',
+    '.raf': 'image/x-fujifilm-raf',
+    '.psd': 'application/vnd.adobe.photoshop',
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/x-m4v',
+    '.mov': 'video/quicktime',
+    '.3gp': 'video/3gpp',
+    '.avi': 'video/x-msvideo',
+    '.mkv': 'video/x-matroska',
+    '.webm': 'video/webm',
+    '.mts': 'video/m2ts',
+    '.m2ts': 'video/m2ts',
+    '.mpg': 'video/mpeg',
+    '.mpeg': 'video/mpeg',
+    '.wmv': 'video/x-ms-wmv',
+}
+
+
+# Extensions of files which are neither photos nor videos
+OTHER_EXTENSIONS = {
+    '.txt', '.md', '.log', '.csv', '.json', '.xml', '.html', '.htm', '.ini', '.plist',
+    '.aae', '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.odt', '.ods',
+    '.zip', '.gz', '.tar', '.7z', '.rar', '.db', '.sqlite', '.exe', '.dll', '.py', '.sh',
+    '.mp3', '.m4a', '.wav', '.flac', '.aac', '.opus',
+}
+
+# Leading bytes of files and their kind. A container holds either a video or
+# something else, so only the extension decides.
+SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image'),
+    (0, b'GIF87a', 'image'),
+    (0, b'GIF89a', 'image'),
+    (0, b'II*\x00', 'image'),
+    (0, b'MM\x00*', 'image'),
+    (0, b'IIRO', 'image'),
+    (0, b'IIU\x00', 'image'),
+    (0, b'FUJIFILMCCD-RAW', 'image'),
+    (0, b'8BPS', 'image'),
+    (0, b'\x00\x00\x01\xba', 'video'),
+    (0, b'\x1aE\xdf\xa3', 'container'),
+    (0, b'0&\xb2u\x8ef\xcf\x11', 'container'),
+    (0, b'%PDF', 'other'),
+    (0, b'PK\x03\x04', 'other'),
+    (0, b'\x1f\x8b', 'other'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'other'),
+    (0, b'Rar!', 'other'),
+    (0, b'SQLite format 3\x00', 'other'),
+    (0, b'\x7fELF', 'other'),
+    (0, b'ID3', 'other'),
+    (0, b'fLaC', 'other'),
+)
+RIFF_TYPES = {b'WEBP': 'image', b'AVI ': 'video', b'WAVE': 'other'}
+# Major brands of ISO base media files (MP4, QuickTime, HEIF, CR3)
+FTYP_BRANDS = {
+    b'heic': 'image', b'heix': 'image', b'heim': 'image', b'heis': 'image',
+    b'hevc': 'image', b'hevx': 'image', b'mif1': 'image', b'msf1': 'image',
+    b'avif': 'image', b'crx ': 'image',
+    b'qt  ': 'video', b'isom': 'video', b'iso2': 'video', b'mp41': 'video',
+    b'mp42': 'video', b'avc1': 'video', b'M4V ': 'video', b'M4VH': 'video',
+    b'M4VP': 'video', b'3gp4': 'video', b'3gp5': 'video', b'3gp6': 'video',
+    b'3g2a': 'video', b'mmp4': 'video', b'MSNV': 'video', b'XAVC': 'video',
+    b'M4A ': 'other', b'M4B ': 'other', b'M4P ': 'other',
+}
+# QuickTime files may start with another atom than ftyp
+QUICKTIME_ATOMS = (b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+HEADER_SIZE = 16
+
+
+def extension_mimetype(filename):
+    """
+    Return the MIME type of a photo or video by its extension, or None
+    """
+    return EXTENSION_MIMETYPES.get(os.path.splitext(filename)[1].lower())
+
+
+def extension_kind(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in OTHER_EXTENSIONS:
+        return 'other'
+    mimetype = EXTENSION_MIMETYPES.get(extension)
+    if mimetype is None:
+        return None
+    return 'video' if mimetype.startswith('video/') else 'image'
+
+
+def header_kind(header):
+    """
+    Return the kind of file the leading bytes belong to, or None
+    """
+    for offset, signature, kind in SIGNATURES:
+        if header.startswith(signature, offset):
+            return kind
+    if header.startswith(b'RIFF'):
+        return RIFF_TYPES.get(header[8:12])
+    if header[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(header[8:12])
+    if header[4:8] in QUICKTIME_ATOMS:
+        return 'video'
+    return None
+
+
+def classify(filename):
+    """
+    Decide whether a file is an 'image', a 'video' or 'other' by its first
+    bytes and its extension, without exiftool. Returns None if that is not
+    certain, e.g. for unknown formats.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+    except OSError:
+        return None
+    kind = header_kind(header)
+    if kind == 'container':
+        return 'video' if extension_kind(filename) == 'video' else None
+    if kind is not None:
+        return kind
+    # Without a known signature, only files which are never media are certain
+    return 'other' if extension_kind(filename) == 'other' else None
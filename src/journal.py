@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class RunJournal(object):
+    """
+    On-disk journal of the files handled by previous runs and their
+    outcome. Entries are keyed by the path, size, modification time and
+    inode of the file and by the settings of the run, so a changed file or
+    a run with other settings processes the file again.
+    """
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, path, signature):
+        self.path = os.path.expanduser(path)
+        self.signature = signature
+        self.lock = threading.Lock()
+        self.run_id = time.time()
+        self.pending = 0
+        self.skipped = 0
+        self.recorded = 0
+        try:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    signature TEXT NOT NULL,
+                    outcome TEXT NOT NULL,
+                    run REAL NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS directories (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    signature TEXT NOT NULL,
+                    children TEXT NOT NULL,
+                    run REAL NOT NULL
+                )""")
+            self.connection.commit()
+        except sqlite3.Error as e:
+            raise OSError(f"Cannot open run journal '{self.path}': {e}")
+
+    @staticmethod
+    def identity(filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def seen(self, filename):
+        """
+        Check if the unchanged file was handled by a run with the same
+        settings
+        """
+        identity = self.identity(filename)
+        if identity is None:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime_ns, inode FROM files WHERE path = ? AND signature = ?',
+                (os.path.abspath(filename), self.signature)).fetchone()
+            if row is None or tuple(row) != identity:
+                return False
+            self.skipped += 1
+        return True
+
+    def record(self, filename, identity, outcome):
+        if identity is None:
+            return
+        values = (os.path.abspath(filename), *identity, self.signature, outcome, self.run_id)
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files '
+                '(path, size, mtime_ns, inode, signature, outcome, run) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', values)
+            self.recorded += 1
+            self.pending += 1
+            if self.pending >= self.COMMIT_INTERVAL:
+                self._commit()
+
+    def unchanged_directory(self, path, mtime_ns):
+        """
+        Return the subdirectories of a directory whose entries did not
+        change since a completed run with the same settings, or None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT mtime_ns, children FROM directories WHERE path = ? AND signature = ?',
+                (os.path.abspath(path), self.signature)).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        return json.loads(row[1])
+
+    def record_directories(self, directories):
+        """
+        Record the modification times and subdirectories of the listed
+        directories once all their files were handled
+        """
+        values = [(os.path.abspath(path), mtime_ns, self.signature, json.dumps(children),
+                   self.run_id)
+                  for path, (mtime_ns, children) in directories.items()]
+        with self.lock:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO directories '
+                '(path, mtime_ns, signature, children, run) '
+                'VALUES (?, ?, ?, ?, ?)', values)
+            self._commit()
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        self.connection.commit()
+        self.pending = 0
@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+
+from src.transfer import TEMP_SUFFIX
+
+logger = logging.getLogger('phockup')
+
+COUNTER_HELP = {
+    'files_processed': "Files processed by the run",
+    'duplicates_found': "Duplicate files found by the run",
+    'unknown_found': "Files without a date found by the run",
+    'files_moved': "Files moved by the run",
+    'files_copied': "Files copied by the run",
+}
+QUANTILES = (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99'))
+
+
+def render(stats, run_time, running):
+    """
+    Format the stats of a run in the Prometheus text exposition format
+    """
+    counters = stats['counters']
+    stages = stats['stages']
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append(f'# HELP phockup_{name} {description}')
+        lines.append(f'# TYPE phockup_{name} {kind}')
+        for suffix, labels, value in samples:
+            labels = ','.join(f'{key}="{label}"' for key, label in labels)
+            labels = f'{{{labels}}}' if labels else ''
+            lines.append(f'phockup_{name}{suffix}{labels} {value}')
+
+    for counter, description in COUNTER_HELP.items():
+        metric(f'{counter}_total', 'counter', description, [('', (), counters[counter])])
+    metric('files_pending', 'gauge', "Files found but not processed yet",
+           [('', (), max(counters['files_pending'], 0))])
+    transferred = sum(stages[stage]['bytes'] for stage in ('copy', 'move') if stage in stages)
+    metric('bytes_transferred_total', 'counter', "Bytes copied or moved by the run",
+           [('', (), transferred)])
+    samples = []
+    for stage, histogram in stages.items():
+        for key, quantile in QUANTILES:
+            samples.append(('', (('stage', stage), ('quantile', quantile)), histogram[key]))
+        samples.append(('_sum', (('stage', stage),), histogram['total']))
+        samples.append(('_count', (('stage', stage),), histogram['count']))
+    metric('stage_duration_seconds', 'summary', "Duration of the stages of processing a file",
+           samples)
+    metric('run_duration_seconds', 'gauge', "Duration of the run so far",
+           [('', (), round(run_time, 3))])
+    metric('run_in_progress', 'gauge', "1 while the run is in progress, 0 once it ended",
+           [('', (), int(running))])
+    metric('last_update_timestamp_seconds', 'gauge', "Time the metrics were written",
+           [('', (), round(time.time(), 3))])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsWriter(object):
+    """
+    Writes the stats of a run to a Prometheus textfile at the end of the
+    run and, with an interval, regularly while it is running. The file is
+    replaced atomically, so a collector never reads half of it.
+    """
+
+    def __init__(self, path, stats, interval=0, start_time=None):
+        self.path = os.path.expanduser(path)
+        self.stats = stats
+        self.interval = interval
+        self.start_time = time.time() if start_time is None else start_time
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write(running=True)
+
+    def stop(self):
+        """
+        Stop writing regularly and write the final metrics
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write(running=False)
+
+    def write(self, running):
+        text = render(self.stats.as_dict(), time.time() - self.start_time, running)
+        # The temporary name does not end with .prom, so it is never collected
+        temp = self.path + TEMP_SUFFIX
+        try:
+            with open(temp, 'w') as f:
+                f.write(text)
+            os.replace(temp, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot write metrics to '{self.path}': {e}")
@@ -0,0 +1,168 @@
+import os
+import threading
+
+
+class Reservation(object):
+    """
+    A name in an output directory. content is the file holding its
+    content: the source file until it is written and during a dry run,
+    and None if it cannot be compared, e.g. for directories.
+    """
+
+    def __init__(self, path, suffix, content):
+        self.path = path
+        self.suffix = suffix
+        self.content = content
+        self.duplicate = None
+        self.released = False
+        self.done = threading.Event()
+
+
+class Listing(object):
+    """
+    The names in an output directory. Names which existed before the run
+    are kept in plain sets, only names reserved during the run have a
+    Reservation. Names are keyed case-insensitively, as on the filesystems
+    of macOS, Windows and memory cards.
+    """
+    __slots__ = ('existing', 'directories', 'actual', 'reserved')
+
+    def __init__(self):
+        self.existing = set()
+        self.directories = set()
+        # The real names of the existing entries whose key differs
+        self.actual = {}
+        self.reserved = {}
+
+    def add(self, name, is_dir=False):
+        key = NameRegistry.key(name)
+        self.existing.add(key)
+        if is_dir:
+            self.directories.add(key)
+        if key != name:
+            self.actual[key] = name
+
+    def discard(self, key):
+        self.existing.discard(key)
+        self.directories.discard(key)
+        self.actual.pop(key, None)
+
+    def name(self, key):
+        return self.actual.get(key, key)
+
+
+class NameRegistry(object):
+    """
+    Names of the files in the output directories. Each directory is listed
+    once, and free names are reserved under a lock, so concurrent workers
+    never write to the same name.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directories = {}
+
+    @staticmethod
+    def key(name):
+        return name.casefold()
+
+    def names(self, directory):
+        listing = self.directories.get(directory)
+        if listing is None:
+            listing = Listing()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        listing.add(entry.name, entry.is_dir())
+            except OSError:
+                pass
+            self.directories[directory] = listing
+        return listing
+
+    def reserve(self, path, content, is_duplicate):
+        """
+        Reserve path, or path with the first free -N suffix, for content.
+        Taken names are compared with is_duplicate first, once they are
+        written. If one of them holds the same content, the returned
+        reservation has its path in duplicate and nothing is reserved.
+        """
+        directory, name = os.path.split(path)
+        base, ext = os.path.splitext(name)
+        suffix = 1
+        while True:
+            candidate = name if suffix == 1 else f'{base}-{suffix}{ext}'
+            key = self.key(candidate)
+            with self.lock:
+                listing = self.names(directory)
+                taken = listing.reserved.get(key)
+                if taken is None:
+                    if key not in listing.existing:
+                        reservation = Reservation(os.path.join(directory, candidate), suffix,
+                                                  content)
+                        listing.reserved[key] = reservation
+                        return reservation
+                    existing = os.path.join(directory, listing.name(key))
+                    comparable = key not in listing.directories
+
+            if taken is None:
+                if not os.path.lexists(existing):
+                    # The file was moved away meanwhile, e.g. from the input directory
+                    with self.lock:
+                        listing.discard(key)
+                    continue
+                if comparable and self.compare(is_duplicate, existing):
+                    return self.duplicate(existing, suffix)
+                suffix += 1
+                continue
+
+            taken.done.wait()
+            if taken.released:
+                # Nothing was written, try the same name again
+                continue
+            if taken.content == taken.path and not os.path.lexists(taken.path):
+                with self.lock:
+                    if listing.reserved.get(key) is taken:
+                        del listing.reserved[key]
+                continue
+            if taken.content is not None and self.compare(is_duplicate, taken.content):
+                return self.duplicate(taken.path, suffix)
+            suffix += 1
+
+    @staticmethod
+    def compare(is_duplicate, path):
+        """
+        A file which cannot be read, e.g. a dangling link or a source moved
+        away meanwhile, holds no duplicate
+        """
+        try:
+            return is_duplicate(path)
+        except OSError:
+            return False
+
+    @staticmethod
+    def duplicate(path, suffix):
+        reservation = Reservation(path, suffix, None)
+        reservation.duplicate = path
+        return reservation
+
+    def release(self, reservation, written):
+        """
+        Finish a reservation. The name is freed again if nothing was written.
+        """
+        if reservation.duplicate is not None:
+            return
+        directory, name = os.path.split(reservation.path)
+        key = self.key(name)
+        if not written:
+            with self.lock:
+                self.directories[directory].reserved.pop(key, None)
+            reservation.released = True
+        elif os.path.lexists(reservation.path):
+            # Compare with the written file from now on, the source may be moved
+            reservation.content = reservation.path
+            with self.lock:
+                listing = self.directories[directory]
+                if listing.reserved.get(key) is reservation:
+                    del listing.reserved[key]
+                    listing.add(name)
+        reservation.done.set()
@@ -0,0 +1,374 @@
+import os
+import re
+import struct
+import sys
+from datetime import datetime, timedelta
+
+
+class NativeExifError(Exception):
+    pass
+
+
+class NativeExif(object):
+    """
+    Reads the date tags phockup needs from the headers of JPEG, HEIC/HEIF
+    and MP4/MOV files without starting exiftool. Only the parts of the file
+    which hold the metadata are read.
+
+    data() returns a dict shaped like the one of Exif.data(), or None when
+    the format is not understood or the file holds metadata which only
+    exiftool can interpret the same way (XMP, maker note time zones).
+    """
+    MAX_SEGMENT = 1024 * 1024
+
+    # Maker notes of these vendors may hold a TimeZone tag, which phockup
+    # applies to the date. Only exiftool reads maker notes.
+    TIMEZONE_MAKES = ('canon', 'nikon', 'olympus', 'om digital', 'pentax', 'ricoh',
+                      'panasonic', 'leica', 'sony', 'fujifilm', 'samsung')
+
+    IFD0_TAGS = {
+        0x010F: 'Make',
+        0x0132: 'ModifyDate',
+    }
+    EXIF_TAGS = {
+        0x9003: 'DateTimeOriginal',
+        0x9004: 'CreateDate',
+        0x9010: 'OffsetTime',
+        0x9011: 'OffsetTimeOriginal',
+        0x9012: 'OffsetTimeDigitized',
+        0x9290: 'SubSecTime',
+        0x9291: 'SubSecTimeOriginal',
+        0x9292: 'SubSecTimeDigitized',
+        0x927C: 'MakerNote',
+    }
+    # Composite tag: (date, sub seconds, offset)
+    SUBSEC_TAGS = {
+        'SubSecDateTimeOriginal': ('DateTimeOriginal', 'SubSecTimeOriginal', 'OffsetTimeOriginal'),
+        'SubSecCreateDate': ('CreateDate', 'SubSecTimeDigitized', 'OffsetTimeDigitized'),
+        'SubSecModifyDate': ('ModifyDate', 'SubSecTime', 'OffsetTime'),
+    }
+
+    # ftyp brands as identified by exiftool
+    BRANDS = {
+        b'qt  ': 'video/quicktime',
+        b'isom': 'video/mp4',
+        b'iso2': 'video/mp4',
+        b'mp41': 'video/mp4',
+        b'mp42': 'video/mp4',
+        b'avc1': 'video/mp4',
+        b'M4V ': 'video/x-m4v',
+        b'M4VP': 'video/x-m4v',
+        b'3gp4': 'video/3gpp',
+        b'3gp5': 'video/3gpp',
+        b'3gp6': 'video/3gpp',
+        b'3g2a': 'video/3gpp2',
+        b'heic': 'image/heic',
+        b'heix': 'image/heic',
+        b'mif1': 'image/heif',
+    }
+    # Legacy QuickTime files start without a ftyp box
+    QUICKTIME_BOXES = (b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+    XMP_UUID = bytes.fromhex('be7acfcb97a942e89c71999491e3afac')
+    QUICKTIME_EPOCH = datetime(1904, 1, 1)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def data(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                head = f.read(12)
+                if head[:3] == b'\xff\xd8\xff':
+                    exif = self.read_jpeg(f)
+                elif head[4:8] == b'ftyp' or head[4:8] in self.QUICKTIME_BOXES:
+                    exif = self.read_isobmff(f)
+                else:
+                    return None
+        except (OSError, NativeExifError, struct.error, IndexError, ValueError,
+                OverflowError):
+            return None
+
+        if exif is None:
+            return None
+        make = exif.pop('Make', '').lower()
+        if exif.pop('MakerNote', None) is not None and make.startswith(self.TIMEZONE_MAKES):
+            return None
+        for composite, (date, subsec, offset) in self.SUBSEC_TAGS.items():
+            if date in exif and (subsec in exif or offset in exif):
+                exif[composite] = f'{exif[date]}' \
+                    f'{"." + str(exif[subsec]) if subsec in exif else ""}' \
+                    f'{exif.get(offset, "")}'
+
+        exif.update(self.file_dates())
+        exif['SourceFile'] = self.filename
+        return exif
+
+    def file_dates(self):
+        """
+        The file system dates exiftool reports with -time:all
+        """
+        stat = os.stat(self.filename)
+        dates = {
+            'FileModifyDate': stat.st_mtime,
+            'FileAccessDate': stat.st_atime,
+        }
+        if sys.platform == 'win32':
+            dates['FileCreateDate'] = stat.st_ctime
+        else:
+            dates['FileInodeChangeDate'] = stat.st_ctime
+        return {tag: self.format_timestamp(value) for tag, value in dates.items()}
+
+    @staticmethod
+    def format_timestamp(timestamp):
+        value = datetime.fromtimestamp(timestamp).astimezone().strftime('%Y:%m:%d %H:%M:%S%z')
+        return f'{value[:-2]}:{value[-2:]}'
+
+    def read_jpeg(self, f):
+        f.seek(2)
+        exif = None
+        while True:
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                break
+            if marker[1] in (0xD9, 0xDA):
+                # End of image or start of the compressed data
+                break
+            length = struct.unpack('>H', marker[2:])[0] - 2
+            if marker[1] == 0xE1:
+                if length > self.MAX_SEGMENT:
+                    raise NativeExifError('APP1 segment too large')
+                segment = f.read(length)
+                if segment.startswith(b'Exif\x00\x00') and exif is None:
+                    exif = self.read_tiff(segment[6:])
+                elif segment.startswith(b'http://ns.adobe.com/'):
+                    # XMP dates are merged into the output by exiftool
+                    return None
+            else:
+                f.seek(length, os.SEEK_CUR)
+        if exif is None:
+            exif = {}
+        exif['MIMEType'] = 'image/jpeg'
+        return exif
+
+    def read_tiff(self, tiff):
+        if tiff[:2] == b'II':
+            order = '<'
+        elif tiff[:2] == b'MM':
+            order = '>'
+        else:
+            raise NativeExifError('Invalid TIFF header')
+        if struct.unpack(order + 'H', tiff[2:4])[0] != 42:
+            raise NativeExifError('Invalid TIFF header')
+
+        exif = {}
+        offset = struct.unpack(order + 'I', tiff[4:8])[0]
+        pointers = self.read_ifd(tiff, order, offset, self.IFD0_TAGS, exif)
+        if 0x8769 in pointers:
+            self.read_ifd(tiff, order, pointers[0x8769], self.EXIF_TAGS, exif)
+        return exif
+
+    def read_ifd(self, tiff, order, offset, tags, exif):
+        count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+        pointers = {}
+        for i in range(count):
+            entry = tiff[offset + 2 + i * 12:offset + 14 + i * 12]
+            tag, kind, components = struct.unpack(order + 'HHI', entry[:8])
+            if tag == 0x8769:
+                pointers[tag] = struct.unpack(order + 'I', entry[8:12])[0]
+            elif tag in tags:
+                if tags[tag] == 'MakerNote':
+                    exif['MakerNote'] = True
+                    continue
+                if kind != 2:
+                    continue
+                if components <= 4:
+                    value = entry[8:8 + components]
+                else:
+                    start = struct.unpack(order + 'I', entry[8:12])[0]
+                    value = tiff[start:start + components]
+                value = value.split(b'\x00')[0].decode('latin-1').strip()
+                if value:
+                    exif[tags[tag]] = self.json_value(value)
+        return pointers
+
+    @staticmethod
+    def json_value(value):
+        # exiftool -j prints values which look like numbers without quotes
+        if re.match(r'^-?(\d|[1-9]\d{1,14})(\.\d{1,16})?$', value):
+            return float(value) if '.' in value else int(value)
+        return value
+
+    def boxes(self, f, end):
+        """
+        Iterate over the ISO base media boxes until offset end, yielding the
+        type, the offset of the payload and the offset of the next box
+        """
+        offset = f.tell()
+        while offset + 8 <= end:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            size, kind = struct.unpack('>I4s', header)
+            payload = offset + 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                payload += 8
+            elif size == 0:
+                size = end - offset
+            if size < payload - offset:
+                raise NativeExifError('Invalid box size')
+            yield kind, payload, offset + size
+            offset += size
+
+    def read_isobmff(self, f):
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        f.seek(0)
+        mimetype = None
+        exif = {}
+        for kind, payload, next_box in self.boxes(f, end):
+            if kind == b'ftyp':
+                f.seek(payload)
+                brand = f.read(4)
+                if brand not in self.BRANDS:
+                    return None
+                mimetype = self.BRANDS[brand]
+            elif mimetype is None and kind in self.QUICKTIME_BOXES:
+                mimetype = 'video/quicktime'
+
+            if kind == b'uuid':
+                f.seek(payload)
+                if f.read(16) == self.XMP_UUID:
+                    return None
+            elif kind == b'moov':
+                f.seek(payload)
+                if not self.read_moov(f, next_box, exif):
+                    return None
+            elif kind == b'meta' and mimetype in ('image/heic', 'image/heif'):
+                if next_box - payload > self.MAX_SEGMENT:
+                    raise NativeExifError('meta box too large')
+                f.seek(payload)
+                meta = self.read_heif_meta(f, f.read(next_box - payload))
+                if meta is None:
+                    return None
+                exif.update(meta)
+
+        if mimetype is None:
+            return None
+        exif['MIMEType'] = mimetype
+        return exif
+
+    def read_moov(self, f, end, exif):
+        for kind, payload, next_box in self.boxes(f, end):
+            if kind == b'mvhd':
+                f.seek(payload)
+                version = f.read(4)[0]
+                if version == 1:
+                    created = struct.unpack('>Q', f.read(8))[0]
+                else:
+                    created = struct.unpack('>I', f.read(4))[0]
+                if created:
+                    date = self.QUICKTIME_EPOCH + timedelta(seconds=created)
+                    exif['CreateDate'] = date.strftime('%Y:%m:%d %H:%M:%S')
+                else:
+                    exif['CreateDate'] = '0000:00:00 00:00:00'
+            elif kind == b'udta':
+                # XMP dates are merged into the output by exiftool
+                f.seek(payload)
+                for child, _, _ in self.boxes(f, next_box):
+                    if child == b'XMP_':
+                        return False
+        return True
+
+    def read_heif_meta(self, f, meta):
+        # meta is a full box: skip version and flags
+        items = {}
+        exif_item = None
+        position = 4
+        locations = {}
+        while position + 8 <= len(meta):
+            size, kind = struct.unpack('>I4s', meta[position:position + 8])
+            if size < 8:
+                raise NativeExifError('Invalid box size')
+            box = meta[position + 8:position + size]
+            if kind == b'iinf':
+                items = self.read_iinf(box)
+            elif kind == b'iloc':
+                locations = self.read_iloc(box)
+            position += size
+
+        for item_id, item_type in items.items():
+            if item_type == b'mime':
+                # XMP is stored as a mime item
+                return None
+            if item_type == b'Exif':
+                exif_item = item_id
+        if exif_item is None or exif_item not in locations:
+            return {}
+
+        offset, length = locations[exif_item]
+        if length > self.MAX_SEGMENT:
+            raise NativeExifError('Exif item too large')
+        f.seek(offset)
+        data = f.read(length)
+        start = 4 + struct.unpack('>I', data[:4])[0]
+        return self.read_tiff(data[start:])
+
+    @staticmethod
+    def read_iinf(box):
+        version = box[0]
+        if version == 0:
+            count = struct.unpack('>H', box[4:6])[0]
+            position = 6
+        else:
+            count = struct.unpack('>I', box[4:8])[0]
+            position = 8
+        items = {}
+        for _ in range(count):
+            size, kind = struct.unpack('>I4s', box[position:position + 8])
+            if kind == b'infe' and box[position + 8] >= 2:
+                infe = box[position + 12:position + size]
+                if box[position + 8] == 2:
+                    item_id = struct.unpack('>H', infe[:2])[0]
+                    item_type = infe[4:8]
+                else:
+                    item_id = struct.unpack('>I', infe[:4])[0]
+                    item_type = infe[6:10]
+                items[item_id] = item_type
+            position += size
+        return items
+
+    @staticmethod
+    def read_iloc(box):
+        def number(size):
+            nonlocal position
+            if size == 0:
+                return 0
+            value = int.from_bytes(box[position:position + size], 'big')
+            position += size
+            return value
+
+        version = box[0]
+        offset_size, length_size = box[4] >> 4, box[4] & 0x0F
+        base_offset_size, index_size = box[5] >> 4, box[5] & 0x0F
+        position = 6
+        count = number(2 if version < 2 else 4)
+        locations = {}
+        for _ in range(count):
+            item_id = number(2 if version < 2 else 4)
+            construction_method = 0
+            if version in (1, 2):
+                construction_method = number(2) & 0x0F
+            number(2)  # data reference index
+            base_offset = number(base_offset_size)
+            extents = number(2)
+            for extent in range(extents):
+                if version in (1, 2):
+                    number(index_size)
+                extent_offset = number(offset_size)
+                extent_length = number(length_size)
+                # Only items stored in one extent of the file itself are supported
+                if construction_method == 0 and extents == 1:
+                    locations[item_id] = (base_offset + extent_offset, extent_length)
+        return locations
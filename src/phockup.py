@@ -1,20 +1,34 @@
 #!/usr/bin/env python3
-import concurrent.futures
-import filecmp
+import json
 import logging
 import os
 import re
-import shutil
 import sys
+import threading
 import time
 
 from tqdm import tqdm
 
+from src.cache import MetadataCache
+from src.checkpoint import Checkpoint
+from src.concurrency import AdaptiveLimiter
 from src.date import Date
-from src.exif import Exif
+from src.duplicate import ContentIndex, FileHasher
+from src.exif import Exif, ExifToolPool
+from src.filetype import classify, extension_kind, extension_mimetype
+from src.journal import RunJournal
+from src.metrics import MetricsWriter
+from src.names import NameRegistry
+from src.native import NativeExif
+from src.pipeline import Pipeline
+from src.plan import PlanWriter, read_plan
+from src.stats import RunStats
+from src.transfer import FileCopier, FileMover
+from src.watch import DirectoryWatcher
 
 logger = logging.getLogger('phockup')
 ignored_files = ('.DS_Store', 'Thumbs.db')
+FILE_TYPES = re.compile('^(?:(?P<image>image/.+|application/vnd.adobe.photoshop)|(?P<video>video/.*))$')
 
 
 class Phockup:
@@ -23,11 +37,14 @@ class Phockup:
 
     def __init__(self, input_dir, output_dir, **args):
         start_time = time.time()
-        self.files_processed = 0
-        self.duplicates_found = 0
-        self.unknown_found = 0
-        self.files_moved = 0
-        self.files_copied = 0
+        # Counters and, with --stats-json, the timings of each stage
+        self.stats_json = args.get('stats_json', None)
+        self.metrics_file = args.get('metrics_file', None)
+        self.stats = RunStats(timing=bool(self.stats_json or self.metrics_file))
+        # Prometheus textfile, written at the end and every metrics_interval seconds
+        self.metrics = MetricsWriter(self.metrics_file, self.stats,
+                                     args.get('metrics_interval') or 0, start_time) \
+            if self.metrics_file else None
 
         input_dir = os.path.expanduser(input_dir)
         output_dir = os.path.expanduser(output_dir)
@@ -47,8 +64,18 @@ class Phockup:
         self.link = args.get('link', False)
         self.original_filenames = args.get('original_filenames', False)
         self.date_regex = args.get('date_regex', None)
+        # The built-in file name patterns to use, all of them by default
+        self.filename_matcher = args.get('filename_matcher', None)
         self.timestamp = args.get('timestamp', False)
         self.date_field = args.get('date_field', False)
+        # Where to look for the date first, e.g. ['filename', 'exif', 'mtime']
+        self.date_source_order = list(args.get('date_source_order') or [])
+        if self.date_source_order and self.timestamp and 'mtime' not in self.date_source_order:
+            self.date_source_order.append('mtime')
+        # With the file name before exif, exiftool is skipped for dated media names
+        self.filename_first = 'filename' in self.date_source_order and (
+            'exif' not in self.date_source_order
+            or self.date_source_order.index('filename') < self.date_source_order.index('exif'))
         self.skip_unknown = args.get("skip_unknown", False)
         self.movedel = args.get("movedel", False),
         self.rmdirs = args.get("rmdirs", False),
@@ -57,6 +84,46 @@ class Phockup:
         self.max_depth = args.get('max_depth', -1)
         # default to concurrency of one to retain existing behavior
         self.max_concurrency = args.get("max_concurrency", 1)
+        # Metadata extraction and file I/O can be tuned separately
+        self.exif_workers = args.get('exif_workers') or max(self.max_concurrency, 1)
+        self.io_workers = args.get('io_workers') or max(self.max_concurrency, 1)
+        # Tune the worker counts while running, using them as upper bounds
+        self.auto_concurrency = args.get('auto_concurrency', False)
+        if self.auto_concurrency:
+            if self.exif_workers == 1:
+                self.exif_workers = AdaptiveLimiter.DEFAULT_MAXIMUM
+            if self.io_workers == 1:
+                self.io_workers = AdaptiveLimiter.DEFAULT_MAXIMUM
+        # 0 keeps extracting the metadata with one exiftool command per file
+        self.exif_batch_size = args.get('exif_batch_size', 0)
+        self.exif_batch = {}
+        # The kinds of the files of a batch, classified while prefetching
+        self.kinds = {}
+        self.exif_batch_lock = threading.Lock()
+        self.native_exif = args.get('native_exif', False)
+        self.hasher = FileHasher()
+        self.names = NameRegistry()
+        self.copier = FileCopier(args.get('copy_method') or 'auto')
+        # Moves between filesystems are verified before the source is removed
+        self.mover = FileMover(self.io_workers)
+        self.output_dirs = set()
+        self.output_dirs_lock = threading.Lock()
+        self.date_paths = {}
+        # The xmp files found while walking the input directory
+        self.sidecars = None
+        # Find duplicates by content anywhere in the output, not only by name
+        self.content_index = ContentIndex(self.output_dir, self.hasher) \
+            if args.get('dedupe_content') else None
+        self.cache = MetadataCache(args['cache']) if args.get('cache') else None
+        self.cache_stats = args.get('cache_stats', False)
+        # Cached dates are only valid for the options they were parsed with
+        self.date_options = json.dumps([
+            bool(self.timestamp),
+            self.date_regex.pattern if self.date_regex else None,
+            self.filename_matcher.names if self.filename_matcher else None,
+            self.date_field or None,
+            self.date_source_order or None,
+        ])
 
         self.from_date = args.get("from_date", None)
         self.to_date = args.get("to_date", None)
@@ -65,30 +132,107 @@ class Phockup:
         if self.to_date is not None:
             self.to_date = Date.strptime(f"{self.to_date} 23:59:59", "%Y-%m-%d %H:%M:%S")
 
-        if self.max_concurrency > 1:
+        if self.auto_concurrency:
+            logger.info(f"Tuning up to {self.exif_workers} workers to extract metadata and "
+                        f"up to {self.io_workers} workers to transfer files.")
+        elif self.exif_workers != self.io_workers:
+            logger.info(f"Using {self.exif_workers} workers to extract metadata and "
+                        f"{self.io_workers} workers to transfer files.")
+        elif self.max_concurrency > 1:
             logger.info(f"Using {self.max_concurrency} workers to process files.")
 
         self.stop_depth = self.input_dir.count(os.sep) + self.max_depth \
             if self.max_depth > -1 else sys.maxsize
         self.file_type = args.get('file_type', None)
 
+        self.journal = RunJournal(args['journal'], self.get_signature()) \
+            if args.get('journal') else None
+        if args.get('since_journal') and self.journal is None:
+            raise RuntimeError("--since-journal requires a --journal")
+        # Skip the directories which did not change since the last run
+        self.since_journal = args.get('since_journal', False) and self.journal is not None \
+            and not self.dry_run
+        self.journal_dirs = {}
+        # Continue an interrupted run from its checkpoint
+        self.resume = args.get('resume', False)
+        # Keep running and process the files added to the input directory
+        self.watch = args.get('watch', False)
+        # Record the decisions of a dry run, or carry out a recorded plan
+        self.plan_out = args.get('plan_out', None)
+        self.apply = args.get('apply', None)
+        if self.plan_out and not self.dry_run:
+            raise RuntimeError("--plan-out requires --dry-run")
+        if self.plan_out and self.apply:
+            raise RuntimeError("--plan-out cannot be combined with --apply")
+        self.plan = None
+
         if self.dry_run:
             logger.warning("Dry-run phockup (does a trial run with no permanent changes)...")
 
+        # Long-lived exiftool processes shared by all workers
+        self.exiftool = ExifToolPool()
+
         self.check_directories()
-        # Get the number of files
-        if self.progress:
-            file_count = self.get_file_count()
-            with tqdm(desc=f"Progressing: '{self.input_dir}' ",
-                      total=file_count,
-                      unit="file",
-                      position=0,
-                      leave=True,
-                      ascii=(sys.platform == 'win32')) as self.pbar:
-                self.walk_directory()
-        else:
-            self.pbar = None
-            self.walk_directory()
+        self.checkpoint = self.start_checkpoint()
+        if self.plan_out:
+            self.plan = PlanWriter(self.plan_out, self.input_dir, self.output_dir,
+                                   self.get_signature())
+        # Watch before the walk, so no file written meanwhile is missed
+        self.watcher = DirectoryWatcher(self.input_dir, self.stop_depth) \
+            if self.watch else None
+        completed = False
+        if self.metrics is not None:
+            self.metrics.start()
+        try:
+            # The total grows while the input directory is walked
+            if self.progress:
+                with tqdm(desc=f"Progressing: '{self.input_dir}' ",
+                          total=0,
+                          unit="file",
+                          position=0,
+                          leave=True,
+                          ascii=(sys.platform == 'win32')) as self.pbar:
+                    completed = self.apply_plan() if self.apply else self.walk_directory()
+            else:
+                self.pbar = None
+                completed = self.apply_plan() if self.apply else self.walk_directory()
+            if completed is True and not self.watch:
+                # There is nothing left to resume
+                self.checkpoint.remove()
+                self.checkpoint = None
+            if completed is True and self.cache is not None:
+                self.cache.evict(self.input_dir)
+            if completed is True and self.since_journal:
+                self.journal.record_directories(self.journal_dirs)
+            if completed is True and self.watch:
+                self.checkpoint.watch()
+                self.watch_directory()
+                self.checkpoint.remove()
+                self.checkpoint = None
+        finally:
+            if self.checkpoint is not None:
+                self.checkpoint.save()
+                self.checkpoint.release()
+            if self.watcher is not None:
+                self.watcher.close()
+            self.exiftool.close()
+            self.mover.close()
+            if self.plan is not None:
+                self.plan.close(completed is True)
+                if completed is True:
+                    logger.info(f"Wrote a plan of {self.plan.entries} files to '{self.plan.path}'.")
+                else:
+                    logger.warning(f"Discarded the plan '{self.plan.path}' of the unfinished run.")
+            if self.journal is not None:
+                self.journal.commit()
+                if self.journal.skipped:
+                    logger.info(f"Skipped {self.journal.skipped} files handled by previous runs.")
+            if self.cache is not None:
+                self.cache.commit()
+                if self.cache_stats:
+                    self.print_cache_stats()
+            if self.metrics is not None:
+                self.metrics.stop()
 
         if self.move and self.rmdirs:
             self.rm_subdirs()
@@ -96,6 +240,28 @@ class Phockup:
         run_time = time.time() - start_time
         if self.files_processed and run_time:
             self.print_action_report(run_time)
+        if self.stats_json:
+            self.write_stats(run_time)
+
+    @property
+    def files_processed(self):
+        return self.stats.get('files_processed')
+
+    @property
+    def duplicates_found(self):
+        return self.stats.get('duplicates_found')
+
+    @property
+    def unknown_found(self):
+        return self.stats.get('unknown_found')
+
+    @property
+    def files_moved(self):
+        return self.stats.get('files_moved')
+
+    @property
+    def files_copied(self):
+        return self.stats.get('files_copied')
 
     def print_action_report(self, run_time):
         logger.info(f"Processed {self.files_processed} files in {run_time:.2f} seconds. Average Throughput: {self.files_processed/run_time:.2f} files/second")
@@ -114,6 +280,66 @@ class Phockup:
             else:
                 logger.info(f"Moved {self.files_moved} files.")
 
+    def write_stats(self, run_time):
+        try:
+            self.stats.write(self.stats_json, run_time)
+        except OSError as e:
+            logger.warning(f"Cannot write stats to '{self.stats_json}': {e}")
+
+    def get_signature(self):
+        """
+        The settings which decide what happens to a file, for the journal
+        """
+        return json.dumps([
+            os.path.abspath(self.output_dir),
+            self.output_prefix,
+            self.output_suffix,
+            self.no_date_dir,
+            self.dir_format,
+            self.date_options,
+            bool(self.move),
+            bool(self.link),
+            bool(self.original_filenames),
+            bool(self.skip_unknown),
+            self.file_type,
+            str(self.from_date),
+            str(self.to_date),
+        ])
+
+    def print_cache_stats(self):
+        stats = self.cache.stats()
+        logger.info(f"Metadata cache '{self.cache.path}': {stats['hits']} hits, {stats['misses']} misses, "
+                    f"{stats['stored']} stored, {stats['evicted']} evicted, {stats['entries']} entries.")
+
+    def start_checkpoint(self):
+        """
+        Clean up after an interrupted run and load its progress with --resume.
+        The checkpoint is saved at once and only removed when the run ends
+        cleanly, so it also marks the runs whose temporary files are left.
+        """
+        checkpoint = Checkpoint(self.output_dir, self.input_dir, enabled=not self.dry_run)
+        if not checkpoint.acquire():
+            raise RuntimeError(f"Another run from '{self.input_dir}' into "
+                               f"'{self.output_dir}' is in progress")
+        if checkpoint.exists() and not self.dry_run:
+            if Checkpoint.others_running(self.output_dir, checkpoint.lock_path):
+                # Their temporary files are still being written
+                logger.warning("Another run into the output directory is in progress, "
+                               "leaving the unfinished files of the previous run.")
+            else:
+                Checkpoint.remove_temp_files(self.output_dir)
+        if checkpoint.exists():
+            if self.resume and checkpoint.load():
+                files = sum(len(names) for names in checkpoint.done_files.values())
+                logger.info(f"Resuming the previous run, {len(checkpoint.done_dirs)} directories "
+                            f"and {files} files are done already.")
+            elif not self.resume:
+                logger.info("The previous run was interrupted, use --resume to continue it.")
+        elif self.resume:
+            logger.info("There is no interrupted run to resume, processing all files.")
+        checkpoint.start()
+        return checkpoint
+
     def check_directories(self):
         """
         Check if input and output directories exist.
@@ -137,28 +363,220 @@ class Phockup:
         """
         Walk input directory recursively and call process_file for each file
         except the ignored ones.
+        Returns False if the walk was interrupted.
+        """
+        if self.auto_concurrency or max(self.exif_workers, self.io_workers) > 1:
+            return self.process_files(self.get_file_chunks(self.exif_workers))
+
+        try:
+            for chunk in self.get_file_chunks(1):
+                self.process_chunk(chunk)
+        except KeyboardInterrupt:
+            logger.warning("Received interrupt. Shutting down...")
+            return False
+        return True
+
+    def get_file_chunks(self, workers):
+        """
+        Walk the input directory lazily and yield the files of each
+        directory in chunks, so huge trees are never listed at once.
+        """
+        for root, file_paths_to_process in self.scan_directory():
+            yield from self.get_chunks(file_paths_to_process, workers)
+
+    def scan_directory(self):
+        """
+        Walk the input directory top-down like os.walk and yield the sorted
+        paths of the files of each directory. The entry types come from
+        os.scandir, so no file is stat'ed, and the progress bar total grows
+        as the directories are listed.
         """
+        self.sidecars = set()
+        roots = [self.input_dir]
+        while roots:
+            root = roots.pop()
+            if self.since_journal:
+                try:
+                    mtime_ns = os.stat(root).st_mtime_ns
+                except OSError:
+                    continue
+                children = self.journal.unchanged_directory(root, mtime_ns)
+                if children is not None:
+                    # No entry was added or removed since the last completed run
+                    if root.count(os.sep) < self.stop_depth:
+                        roots.extend(reversed([os.path.join(root, c) for c in children]))
+                    continue
+
+            files = []
+            dirs = []
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            # Like os.walk, do not descend into linked directories
+                            if not entry.is_symlink():
+                                dirs.append(entry.path)
+                        elif entry.name not in ignored_files:
+                            files.append(entry.name)
+            except OSError:
+                continue
+
+            if self.since_journal:
+                self.journal_dirs[root] = (mtime_ns, [os.path.basename(d) for d in dirs])
 
-        # Walk the directory
-        for root, dirnames, files in os.walk(self.input_dir):
             files.sort()
-            file_paths_to_process = []
-            for filename in files:
-                if filename in ignored_files:
+            file_paths = [os.path.join(root, filename) for filename in files]
+            if self.checkpoint is not None:
+                file_paths = self.checkpoint.pending(root, file_paths)
+            self.sidecars.update(f for f in file_paths if f.endswith('.xmp'))
+            count = sum(1 for f in file_paths if not f.endswith('.xmp'))
+            self.stats.increment('files_pending', count)
+            if self.pbar is not None:
+                self.pbar.total += count
+                self.pbar.refresh()
+            yield root, file_paths
+
+            if root.count(os.sep) < self.stop_depth:
+                roots.extend(reversed(dirs))
+
+    def watch_directory(self):
+        """
+        Process the files written to the input directory until interrupted.
+        The exiftool processes and caches stay warm between the files. The
+        watches were added before the walk, so the files written during it
+        are processed as well.
+        """
+        logger.info(f"Watching '{self.input_dir}' for new files...")
+        try:
+            for file_paths in self.watcher.batches():
+                file_paths = [f for f in file_paths
+                              if os.path.basename(f) not in ignored_files]
+                if self.sidecars is not None:
+                    self.sidecars.update(f for f in file_paths if f.endswith('.xmp'))
+                self.stats.increment('files_pending',
+                                     sum(1 for f in file_paths if not f.endswith('.xmp')))
+                if self.auto_concurrency or max(self.exif_workers, self.io_workers) > 1:
+                    if not self.process_files(self.get_chunks(file_paths, self.exif_workers)):
+                        break
+                else:
+                    for chunk in self.get_chunks(file_paths, 1):
+                        self.process_chunk(chunk)
+        except KeyboardInterrupt:
+            logger.warning("Received interrupt. Stopped watching.")
+
+    def apply_plan(self):
+        """
+        Carry out the actions of a plan written by a dry run with --plan-out.
+        The metadata is not extracted again, only files whose size or
+        modification time changed since are skipped.
+        """
+        header, entries = read_plan(self.apply)
+        if header['input_dir'] != os.path.abspath(self.input_dir) \
+                or header['output_dir'] != os.path.abspath(self.output_dir):
+            raise RuntimeError(f"The plan '{self.apply}' is for '{header['input_dir']}' => "
+                               f"'{header['output_dir']}'")
+
+        # Duplicates are deleted last, once the files they match are in place
+        deletes = []
+
+        def counted(entries):
+            for entry in entries:
+                if self.pbar is not None:
+                    self.pbar.total += 1
+                    self.pbar.refresh()
+                if entry['action'] == 'delete':
+                    deletes.append(entry)
                     continue
-                file_paths_to_process.append(os.path.join(root, filename))
-            if self.max_concurrency > 1:
-                if not self.process_files(file_paths_to_process):
-                    return
-            else:
+                yield entry
+
+        try:
+            if self.auto_concurrency or max(self.exif_workers, self.io_workers) > 1:
                 try:
-                    for file_path in file_paths_to_process:
-                        self.process_file(file_path)
+                    Pipeline([(self.apply_entry, self.io_workers)]).run(counted(entries))
                 except KeyboardInterrupt:
-                    logger.warning("Received interrupt. Shutting down...")
-                    return
-            if root.count(os.sep) >= self.stop_depth:
-                del dirnames[:]
+                    logger.warning(
+                        f"Received interrupt. Shutting down {self.io_workers} workers...")
+                    return False
+            else:
+                for entry in counted(entries):
+                    self.apply_entry(entry)
+            for entry in deletes:
+                self.apply_entry(entry)
+        except KeyboardInterrupt:
+            logger.warning("Received interrupt. Shutting down...")
+            return False
+        return True
+
+    def apply_entry(self, entry):
+        source = entry['source']
+        action = entry['action']
+        progress = f'{source}'
+        identity = RunJournal.identity(source)
+        if identity is None or identity[:2] != (entry['size'], entry['mtime_ns']):
+            logger.warning(f'{progress} => skipped, changed since the plan was made')
+            return
+
+        if action == 'skip':
+            progress = f"{progress} => skipped, {entry['reason']}"
+            if entry['reason'] == 'duplicate':
+                self.stats.increment('duplicates_found')
+            elif entry['reason'] == 'unknown':
+                self.stats.increment('unknown_found')
+            outcome = entry['reason']
+        elif action == 'delete':
+            duplicate = entry['duplicate']
+            if not os.path.isfile(duplicate) or not self.hasher.same(source, duplicate):
+                logger.warning(f'{progress} => skipped, {duplicate} is gone or changed')
+                return
+            if not self.dry_run:
+                os.remove(source)
+            progress = f'{progress} => deleted, duplicated file {duplicate}'
+            self.stats.increment('duplicates_found')
+            outcome = 'duplicate'
+        else:
+            target = entry['target']
+            if os.path.lexists(target):
+                logger.warning(f'{progress} => skipped, {target} exists since the plan was made')
+                return
+            self.make_output_dir(os.path.dirname(target))
+            self.apply_action(action, source, target)
+            for original, xmp_path in entry['sidecars']:
+                if os.path.isfile(original) and not os.path.lexists(xmp_path):
+                    logger.info(f'{original} => {xmp_path}')
+                    self.apply_action(action, original, xmp_path, counted=False)
+            progress = f'{progress} => {target}'
+            outcome = {'move': 'moved', 'link': 'linked'}.get(action, 'copied')
+
+        if self.progress:
+            self.pbar.write(progress)
+        logger.info(progress)
+        if self.journal is not None and not self.dry_run:
+            self.journal.record(source, identity, outcome)
+        self.stats.increment('files_processed')
+        if self.progress:
+            self.pbar.update(1)
+
+    def apply_action(self, action, source, target, counted=True):
+        if action == 'move':
+            if counted:
+                self.stats.increment('files_moved')
+            if not self.dry_run:
+                with self.stats.timer('move', self.get_size(source) if self.stats.timing else 0):
+                    self.mover.move(source, target)
+        elif action == 'link':
+            if not self.dry_run:
+                with self.stats.timer('link'):
+                    os.link(source, target)
+        else:
+            if counted:
+                self.stats.increment('files_copied')
+            if not self.dry_run:
+                with self.stats.timer('copy', self.get_size(source) if self.stats.timing else 0):
+                    self.copier.copy(source, target)
 
     def rm_subdirs(self):
         def _get_depth(sub_path):
@@ -178,28 +596,16 @@ class Phockup:
                 except OSError as e:
                     logger.info(f"{e.strerror} - {dir_path} not deleted.")
 
-    def get_file_count(self):
-        file_count = 0
-        for root, dirnames, files in os.walk(self.input_dir):
-            file_count += len(files)
-            if root.count(os.sep) >= self.stop_depth:
-                del dirnames[:]
-        return file_count
-
     def get_file_type(self, mimetype):
         """
         Check if given file_type is image or video
         Return None if other
         Use mimetype to determine if the file is an image or video.
         """
-        patternImage = re.compile('^(image/.+|application/vnd.adobe.photoshop)$')
-        if patternImage.match(mimetype):
-            return 'image'
-
-        patternVideo = re.compile('^(video/.*)$')
-        if patternVideo.match(mimetype):
-            return 'video'
-        return None
+        matches = FILE_TYPES.match(mimetype)
+        if matches is None:
+            return None
+        return matches.lastgroup
 
     def get_output_dir(self, date):
         """
@@ -209,9 +615,14 @@ class Phockup:
         directory unless user included a regex from filename or uses timestamp.
         """
         try:
+            day = date['date'].date()
+            formatted = self.date_paths.get(day)
+            if formatted is None:
+                formatted = day.strftime(self.dir_format)
+                self.date_paths[day] = formatted
             path = [self.output_dir,
                     self.output_prefix,
-                    date['date'].date().strftime(self.dir_format),
+                    formatted,
                     self.output_suffix]
         except (TypeError, ValueError):
             path = [self.output_dir,
@@ -222,11 +633,20 @@ class Phockup:
         path = [p for p in path if p is not None]
         fullpath = os.path.normpath(os.path.sep.join(path))
 
-        if not os.path.isdir(fullpath) and not self.dry_run:
-            os.makedirs(fullpath, exist_ok=True)
-
+        self.make_output_dir(fullpath)
         return fullpath
 
+    def make_output_dir(self, fullpath):
+        # A run targets few directories, so check each of them only once
+        with self.output_dirs_lock:
+            known = fullpath in self.output_dirs
+        if not known:
+            if not os.path.isdir(fullpath) and not self.dry_run:
+                with self.stats.timer('makedirs'):
+                    os.makedirs(fullpath, exist_ok=True)
+            with self.output_dirs_lock:
+                self.output_dirs.add(fullpath)
+
     def get_file_name(self, original_filename, date):
         """
         Generate file name based on exif data unless it is missing or
@@ -254,22 +674,152 @@ class Phockup:
         except TypeError:
             return os.path.basename(original_filename)
 
-    def process_files(self, file_paths_to_process):
-        # With all the appropriate files in the directory added to the
-        # list, process the directory concurrently using threads
-        with concurrent.futures.ThreadPoolExecutor(
-                max_workers=self.max_concurrency) as executor:
-            try:
-                for _ in executor.map(self.process_file,
-                                      file_paths_to_process):
-                    pass
-            except KeyboardInterrupt:
-                logger.warning(
-                        f"Received interrupt. Shutting down {self.max_concurrency} workers...")
-                executor.shutdown(wait=True)
-                return False
+    def get_chunks(self, file_paths, workers):
+        """
+        Split the files of a directory into chunks whose metadata is extracted
+        with a single exiftool command. Chunks hold at most exif_batch_size
+        files and are small enough to keep all workers busy.
+        """
+        if self.exif_batch_size <= 1:
+            return [[file_path] for file_path in file_paths]
+        size = max(1, min(self.exif_batch_size, -(-len(file_paths) // workers)))
+        return [file_paths[i:i + size] for i in range(0, len(file_paths), size)]
+
+    def process_chunk(self, chunk):
+        chunk = self.skip_journaled(chunk)
+        if len(chunk) > 1:
+            self.prefetch_exif(chunk)
+        try:
+            for file_path in chunk:
+                self.process_file(file_path)
+        finally:
+            if len(chunk) > 1:
+                with self.exif_batch_lock:
+                    for file_path in chunk:
+                        self.exif_batch.pop(file_path, None)
+                        self.kinds.pop(file_path, None)
+
+    def skip_journaled(self, file_paths):
+        """
+        Drop the files handled by a previous run with the same settings,
+        before any metadata is extracted
+        """
+        if self.journal is None:
+            return file_paths
+        remaining = []
+        for file_path in file_paths:
+            if file_path.endswith('.xmp') or not self.journal.seen(file_path):
+                remaining.append(file_path)
+                continue
+            logger.debug(f'{file_path} => skipped, handled by a previous run')
+            self.stats.increment('files_pending', -1)
+            if self.checkpoint is not None:
+                self.checkpoint.done(file_path)
+            if self.progress:
+                self.pbar.update(1)
+        return remaining
+
+    def prefetch_exif(self, file_paths):
+        file_paths = [f for f in file_paths if not f.endswith('.xmp')]
+        if self.filename_first:
+            file_paths = [f for f in file_paths if self.get_filename_date(f) is None]
+        kinds = {}
+        for file_path in file_paths:
+            with self.stats.timer('classify'):
+                kinds[file_path] = self.get_kind(file_path)
+        file_paths = [f for f in file_paths if kinds[f] is None]
+        if self.cache is not None:
+            file_paths = [f for f in file_paths if not self.cache.contains(f)]
+        data = {}
+        if self.native_exif:
+            for file_path in file_paths:
+                exif_data = self.get_native_exif(file_path)
+                if exif_data is not None:
+                    data[file_path] = exif_data
+            file_paths = [f for f in file_paths if f not in data]
+        if len(file_paths) > 1:
+            with self.stats.timer('exif_batch'):
+                data.update(self.exiftool.batch_data(file_paths))
+        with self.exif_batch_lock:
+            self.exif_batch.update(data)
+            self.kinds.update(kinds)
+
+    def get_exif_data(self, filename):
+        """
+        Return the exif data prefetched for the file or extract it now
+        """
+        with self.exif_batch_lock:
+            exif_data = self.exif_batch.pop(filename, None)
+        if exif_data is not None:
+            return exif_data
+        if self.native_exif:
+            exif_data = self.get_native_exif(filename)
+            if exif_data is not None:
+                return exif_data
+        return Exif(filename, self.exiftool).data()
+
+    def get_native_exif(self, filename):
+        """
+        Read the exif data without exiftool. The data is only used if it holds
+        one of the date fields, otherwise exiftool may still find a date.
+        """
+        exif_data = NativeExif(filename).data()
+        if exif_data is None:
+            return None
+        fields = self.date_field.split() if self.date_field else Date.DEFAULT_FIELDS
+        if any(field in exif_data for field in fields):
+            return exif_data
+        return None
+
+    def process_files(self, chunks):
+        """
+        Process the chunks in a pipeline: the walker feeds a metadata stage,
+        which feeds a transfer stage. The stages run concurrently, so slow
+        files do not hold back the next directories.
+        """
+        def transfer(item):
+            self.transfer_file(*item)
+
+        if self.auto_concurrency:
+            exif_limiter = AdaptiveLimiter('metadata', self.exif_workers)
+            io_limiter = AdaptiveLimiter('transfer', self.io_workers)
+            stages = [(lambda chunk: exif_limiter.run(self.prepare_chunk, chunk, len(chunk)),
+                       self.exif_workers),
+                      (lambda item: io_limiter.run(transfer, item), self.io_workers)]
+        else:
+            stages = [(self.prepare_chunk, self.exif_workers),
+                      (transfer, self.io_workers)]
+
+        try:
+            Pipeline(stages).run(chunks)
+        except KeyboardInterrupt:
+            logger.warning(
+                    f"Received interrupt. Shutting down {self.exif_workers + self.io_workers} workers...")
+            return False
+        finally:
+            if self.auto_concurrency:
+                logger.info(f"Auto concurrency chose --exif-workers={exif_limiter.chosen} "
+                            f"--io-workers={io_limiter.chosen}")
         return True
 
+    def prepare_chunk(self, chunk):
+        """
+        Extract the metadata of a chunk and return the files with their
+        target paths
+        """
+        chunk = self.skip_journaled(chunk)
+        if len(chunk) > 1:
+            self.prefetch_exif(chunk)
+        try:
+            return [(file_path, self.get_file_name_and_path(file_path))
+                    for file_path in chunk if not file_path.endswith('.xmp')]
+        finally:
+            if len(chunk) > 1:
+                with self.exif_batch_lock:
+                    for file_path in chunk:
+                        self.exif_batch.pop(file_path, None)
+                        self.kinds.pop(file_path, None)
+
     def process_file(self, filename):
         """
         Process the file using the selected strategy
@@ -278,106 +828,208 @@ class Phockup:
         if str.endswith(filename, '.xmp'):
             return None
 
+        self.transfer_file(filename, self.get_file_name_and_path(filename))
+
+    def transfer_file(self, filename, file_name_and_path):
+        """
+        Copy, move or link the file to the target returned by
+        get_file_name_and_path
+        """
+        identity = None
+        if self.journal is not None and not self.dry_run:
+            # Before the file is moved away
+            identity = RunJournal.identity(filename)
+        outcome = self.place_file(filename, file_name_and_path)
+        if self.plan is not None and outcome in ('filtered', 'unknown'):
+            self.plan.record(filename, 'skip', reason=outcome)
+        if identity is not None and outcome is not None:
+            self.journal.record(filename, identity, outcome)
+        if self.checkpoint is not None:
+            self.checkpoint.done(filename)
+        self.stats.increment('files_processed')
+        self.stats.increment('files_pending', -1)
+        if self.progress:
+            self.pbar.update(1)
+
+    def place_file(self, filename, file_name_and_path):
+        """
+        Returns the outcome for the journal, or None if the file is gone
+        """
         progress = f'{filename}'
 
-        output, target_file_name, target_file_path, target_file_type, file_date = self.get_file_name_and_path(filename)
-        suffix = 1
-        target_file = target_file_path
+        output, target_file_name, target_file_path, target_file_type, file_date = file_name_and_path
 
-        while True:
-            if self.file_type is not None \
-                    and self.file_type != target_file_type:
-                progress = f"{progress} => skipped, file is '{target_file_type}' \
+        if self.file_type is not None \
+                and self.file_type != target_file_type:
+            progress = f"{progress} => skipped, file is '{target_file_type}' \
 but looking for '{self.file_type}'"
-                logger.info(progress)
-                break
+            logger.info(progress)
+            return 'filtered'
+
+        date_unknown = file_date is None or output.endswith(self.no_date_dir)
+        if self.skip_unknown and output.endswith(self.no_date_dir):
+            # Skip files that didn't generate a path from EXIF data
+            progress = f"{progress} => skipped, unknown date EXIF information for '{target_file_name}'"
+            self.stats.increment('unknown_found')
+            if self.progress:
+                self.pbar.write(progress)
+            logger.info(progress)
+            return 'unknown'
 
-            date_unknown = file_date is None or output.endswith(self.no_date_dir)
-            if self.skip_unknown and output.endswith(self.no_date_dir):
-                # Skip files that didn't generate a path from EXIF data
-                progress = f"{progress} => skipped, unknown date EXIF information for '{target_file_name}'"
-                self.unknown_found += 1
+        if not date_unknown:
+            skip = False
+            if type(file_date) is dict:
+                file_date = file_date["date"]
+            if self.from_date is not None and file_date < self.from_date:
+                progress = f"{progress} => {filename} skipped: date {file_date} is older than --from-date {self.from_date}"
+                skip = True
+            if self.to_date is not None and file_date > self.to_date:
+                progress = f"{progress} => {filename} skipped: date {file_date} is newer than --to-date {self.to_date}"
+                skip = True
+            if skip:
                 if self.progress:
                     self.pbar.write(progress)
                 logger.info(progress)
-                break
-
-            if not date_unknown:
-                skip = False
-                if type(file_date) is dict:
-                    file_date = file_date["date"]
-                if self.from_date is not None and file_date < self.from_date:
-                    progress = f"{progress} => {filename} skipped: date {file_date} is older than --from-date {self.from_date}"
-                    skip = True
-                if self.to_date is not None and file_date > self.to_date:
-                    progress = f"{progress} => {filename} skipped: date {file_date} is newer than --to-date {self.to_date}"
-                    skip = True
-                if skip:
+                return 'filtered'
+
+        if self.content_index is not None:
+            with self.stats.timer('content_index'):
+                duplicate = self.content_index.find(filename)
+            if duplicate is not None and os.path.abspath(duplicate) != os.path.abspath(filename):
+                self.skip_duplicate(filename, duplicate, progress)
+                return 'duplicate'
+
+        # Reserve the first free name, unless one of the taken names is a duplicate
+        with self.stats.timer('duplicate_check'):
+            reservation = self.names.reserve(
+                target_file_path, filename,
+                lambda content: content != filename and self.hasher.same(filename, content))
+        if reservation.duplicate is not None:
+            self.skip_duplicate(filename, reservation.duplicate, progress)
+            return 'duplicate'
+
+        target_file = reservation.path
+        size = self.get_size(filename) if self.stats.timing else 0
+        written = False
+        try:
+            if self.move:
+                try:
+                    self.stats.increment('files_moved')
+                    if not self.dry_run:
+                        with self.stats.timer('move', size):
+                            self.mover.move(filename, target_file)
+                except FileNotFoundError:
+                    progress = f'{progress} => skipped, no such file or directory'
                     if self.progress:
                         self.pbar.write(progress)
-                    logger.info(progress)
-                    break
-
-            if os.path.isfile(target_file):
-                if filename != target_file and filecmp.cmp(filename, target_file, shallow=False):
-                    if self.movedel and self.move and self.skip_unknown:
-                        if not self.dry_run:
-                            os.remove(filename)
-                        progress = f'{progress} => deleted, duplicated file {target_file}'
-                    else:
-                        progress = f'{progress} => skipped, duplicated file {target_file}'
-                    self.duplicates_found += 1
+                    logger.warning(progress)
+                    return None
+            elif self.link and not self.dry_run:
+                with self.stats.timer('link'):
+                    os.link(filename, target_file)
+            else:
+                try:
+                    self.stats.increment('files_copied')
+                    if not self.dry_run:
+                        with self.stats.timer('copy', size):
+                            self.copier.copy(filename, target_file)
+                except FileNotFoundError:
+                    progress = f'{progress} => skipped, no such file or directory'
                     if self.progress:
                         self.pbar.write(progress)
-                    logger.info(progress)
-                    break
-            else:
-                if self.move:
-                    try:
-                        self.files_moved += 1
-                        if not self.dry_run:
-                            shutil.move(filename, target_file)
-                    except FileNotFoundError:
-                        progress = f'{progress} => skipped, no such file or directory'
-                        if self.progress:
-                            self.pbar.write(progress)
-                        logger.warning(progress)
-                        break
-                elif self.link and not self.dry_run:
-                    os.link(filename, target_file)
-                else:
-                    try:
-                        self.files_copied += 1
-                        if not self.dry_run:
-                            shutil.copy2(filename, target_file)
-                    except FileNotFoundError:
-                        progress = f'{progress} => skipped, no such file or directory'
-                        if self.progress:
-                            self.pbar.write(progress)
-                        logger.warning(progress)
-                        break
-
-                progress = f'{progress} => {target_file}'
-                if self.progress:
-                    self.pbar.write(progress)
-                logger.info(progress)
+                    logger.warning(progress)
+                    return None
+            written = True
+        finally:
+            self.names.release(reservation, written)
 
-                self.process_xmp(filename, target_file_name, suffix, output)
-                break
+        progress = f'{progress} => {target_file}'
+        if self.progress:
+            self.pbar.write(progress)
+        logger.info(progress)
 
-            suffix += 1
-            target_split = os.path.splitext(target_file_path)
-            target_file = f'{target_split[0]}-{suffix}{target_split[1]}'
+        if self.content_index is not None:
+            self.index_target(filename, target_file)
+        with self.stats.timer('xmp'):
+            sidecars = self.process_xmp(filename, target_file_name, reservation.suffix, output)
+        if self.plan is not None:
+            action = 'move' if self.move else 'link' if self.link else 'copy'
+            date = file_date['date'] if isinstance(file_date, dict) else file_date
+            self.plan.record(filename, action, target_file, date, sidecars)
+        if self.move:
+            return 'moved'
+        return 'linked' if self.link and not self.dry_run else 'copied'
 
-        self.files_processed += 1
+    def skip_duplicate(self, filename, duplicate, progress):
+        if self.movedel and self.move and self.skip_unknown:
+            if not self.dry_run:
+                os.remove(filename)
+            progress = f'{progress} => deleted, duplicated file {duplicate}'
+            action = 'delete'
+        else:
+            progress = f'{progress} => skipped, duplicated file {duplicate}'
+            action = 'skip'
+        if self.plan is not None:
+            self.plan.record(filename, action, reason='duplicate', duplicate=duplicate)
+        self.stats.increment('duplicates_found')
         if self.progress:
-            self.pbar.update(1)
+            self.pbar.write(progress)
+        logger.info(progress)
+
+    @staticmethod
+    def get_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def index_target(self, filename, target_file):
+        # Nothing is written during a dry run, so index the source instead
+        written = filename if self.dry_run else target_file
+        if not self.dry_run:
+            # The target has the content of the source, which is hashed already
+            self.hasher.carry(filename, target_file, forget=self.move)
+        try:
+            size = os.path.getsize(written)
+        except OSError:
+            return
+        self.content_index.add(target_file, size, written)
 
     def get_file_name_and_path(self, filename):
         """
         Returns target file name and path
         """
-        exif_data = Exif(filename).data()
+        cached = self.cache.get(filename) if self.cache is not None else None
+        filename_date = None
+        kind = None
+        if cached is None and self.filename_first:
+            with self.stats.timer('filename_date'):
+                filename_date = self.get_filename_date(filename)
+        if cached is None and filename_date is None:
+            with self.exif_batch_lock:
+                prefetched = filename in self.kinds
+                kind = self.kinds.pop(filename, None)
+            if not prefetched:
+                with self.stats.timer('classify'):
+                    kind = self.get_kind(filename)
+        if kind is not None and kind != 'other':
+            # Not the --file-type, it is skipped and the target does not matter
+            target_file_name = os.path.basename(filename)
+            output = os.path.sep.join([self.output_dir, self.no_date_dir])
+            return output, target_file_name, os.path.sep.join([output, target_file_name]), \
+                kind, None
+        if filename_date is not None:
+            # The name is authoritative, so exiftool is not needed
+            mimetype, filename_date = filename_date
+            exif_data = {'MIMEType': mimetype}
+        elif cached is not None:
+            exif_data = cached['exif']
+        elif kind == 'other':
+            # Neither a photo nor a video, so exiftool is not needed
+            exif_data = None
+        else:
+            with self.stats.timer('exif'):
+                exif_data = self.get_exif_data(filename)
         target_file_type = None
 
         if exif_data and 'MIMEType' in exif_data:
@@ -385,22 +1037,80 @@ but looking for '{self.file_type}'"
 
         date = None
         if target_file_type in ['image', 'video']:
-            date = Date(filename).from_exif(exif_data, self.timestamp, self.date_regex,
-                                            self.date_field)
+            if filename_date is not None:
+                date = filename_date
+            elif cached is not None and cached['date_options'] == self.date_options:
+                date = cached['date']
+            else:
+                with self.stats.timer('date'):
+                    date = self.get_date(filename, exif_data)
+                if self.cache is not None:
+                    self.cache.put(filename, exif_data, self.date_options, date)
             output = self.get_output_dir(date)
             target_file_name = self.get_file_name(filename, date)
             if not self.original_filenames:
                 target_file_name = target_file_name.lower()
         else:
+            if self.cache is not None and cached is None:
+                self.cache.put(filename, exif_data)
             output = self.get_output_dir([])
             target_file_name = os.path.basename(filename)
 
         target_file_path = os.path.sep.join([output, target_file_name])
         return output, target_file_name, target_file_path, target_file_type, date
 
+    def get_kind(self, filename):
+        """
+        Return the kind of a file which is certainly not handled like a photo
+        or video of the --file-type: 'other', or 'image' or 'video' if it is
+        not the --file-type. Returns None if exiftool has to decide.
+        """
+        if self.file_type is None and extension_kind(filename) in ('image', 'video'):
+            # Only files which are no photo or video matter, so the header of
+            # a file named like one is not read
+            return None
+        kind = classify(filename)
+        if kind == 'other':
+            return kind
+        if kind is not None and self.file_type is not None and kind != self.file_type:
+            return kind
+        return None
+
+    def get_filename_date(self, filename):
+        """
+        Return the MIME type by the extension and the date from the name of a
+        photo or video, or None if either is unknown
+        """
+        mimetype = extension_mimetype(filename)
+        if mimetype is None:
+            return None
+        date = Date(filename).from_filename(self.date_regex, None, self.filename_matcher)
+        if date is None:
+            return None
+        return mimetype, date
+
+    def get_date(self, filename, exif_data):
+        """
+        Return the date from the first of the date sources which has one
+        """
+        if not self.date_source_order:
+            return Date(filename).from_exif(exif_data, self.timestamp, self.date_regex,
+                                            self.date_field, self.filename_matcher)
+        for source in self.date_source_order:
+            if source == 'exif':
+                date = Date().from_exif(exif_data, date_field=self.date_field)
+            elif source == 'filename':
+                date = Date(filename).from_filename(self.date_regex, None, self.filename_matcher)
+            else:
+                date = Date(filename).from_timestamp()
+            if date is not None and date['date'] is not None:
+                return date
+        return None
+
     def process_xmp(self, original_filename, file_name, suffix, output):
         """
-        Process xmp files. These are metadata for RAW images
+        Process xmp files. These are metadata for RAW images.
+        Returns the xmp files with their targets.
         """
         xmp_original_with_ext = original_filename + '.xmp'
         xmp_original_without_ext = os.path.splitext(original_filename)[0] + '.xmp'
@@ -409,21 +1119,35 @@ but looking for '{self.file_type}'"
 
         xmp_files = {}
 
-        if os.path.isfile(xmp_original_with_ext):
+        if self.has_sidecar(xmp_original_with_ext):
             xmp_target = f'{file_name}{suffix}.xmp'
             xmp_files[xmp_original_with_ext] = xmp_target
-        if os.path.isfile(xmp_original_without_ext):
+        if self.has_sidecar(xmp_original_without_ext):
             xmp_target = f'{(os.path.splitext(file_name)[0])}{suffix}.xmp'
             xmp_files[xmp_original_without_ext] = xmp_target
 
+        sidecars = []
         for original, target in xmp_files.items():
             xmp_path = os.path.sep.join([output, target])
             logger.info(f'{original} => {xmp_path}')
+            sidecars.append((original, xmp_path))
 
             if not self.dry_run:
                 if self.move:
-                    shutil.move(original, xmp_path)
+                    self.mover.move(original, xmp_path)
+                    if self.sidecars is not None:
+                        self.sidecars.discard(original)
                 elif self.link:
                     os.link(original, xmp_path)
                 else:
-                    shutil.copy2(original, xmp_path)
+                    self.copier.copy(original, xmp_path)
+        return sidecars
+
+    def has_sidecar(self, path):
+        """
+        Check if the xmp file exists, using the listing of the walk if there
+        is one
+        """
+        if self.sidecars is None:
+            return os.path.isfile(path)
+        return path in self.sidecars
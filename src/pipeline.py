@@ -0,0 +1,99 @@
+import queue
+import threading
+
+
+class Pipeline(object):
+    """
+    Streams items through stages connected by bounded queues. Every stage
+    has its own worker threads, so the slowest stage limits the throughput
+    and the number of queued items stays bounded.
+
+    A stage is a (function, workers) tuple. The function receives one item
+    and returns an iterable of items for the next stage (or None).
+    """
+    QUEUE_SIZE_PER_WORKER = 4
+    POLL_INTERVAL = 0.1
+
+    _DONE = object()
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=workers * self.QUEUE_SIZE_PER_WORKER)
+                       for _, workers in stages]
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.running = [workers for _, workers in stages]
+        self.error = None
+        self.threads = []
+
+    def run(self, items):
+        """
+        Feed the items into the first stage and wait until all stages are
+        done. On KeyboardInterrupt the queued items are dropped, the items
+        in progress are finished and the interrupt is raised again.
+        """
+        for index, (_, workers) in enumerate(self.stages):
+            for _ in range(workers):
+                thread = threading.Thread(target=self.work, args=(index,), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        try:
+            try:
+                for item in items:
+                    if self.stopped.is_set():
+                        break
+                    self.put(0, item)
+            finally:
+                self.finish(0)
+            self.join()
+        except KeyboardInterrupt:
+            self.stopped.set()
+            self.join()
+            raise
+        if self.error is not None:
+            raise self.error
+
+    def put(self, index, item):
+        # Poll so the feeding thread stays responsive to interrupts
+        while True:
+            try:
+                self.queues[index].put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                if self.stopped.is_set() and item is not self._DONE:
+                    return
+
+    def finish(self, index):
+        for _ in range(self.stages[index][1]):
+            self.put(index, self._DONE)
+
+    def join(self):
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(self.POLL_INTERVAL)
+
+    def work(self, index):
+        function = self.stages[index][0]
+        last = index == len(self.stages) - 1
+        while True:
+            item = self.queues[index].get()
+            if item is self._DONE:
+                break
+            if self.stopped.is_set():
+                continue
+            try:
+                results = function(item)
+                if not last and results is not None:
+                    for result in results:
+                        self.put(index + 1, result)
+            except BaseException as e:
+                with self.lock:
+                    if self.error is None:
+                        self.error = e
+                self.stopped.set()
+
+        with self.lock:
+            self.running[index] -= 1
+            done = self.running[index] == 0
+        if done and not last:
+            self.finish(index + 1)
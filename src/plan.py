@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+
+from src.transfer import TEMP_SUFFIX
+
+VERSION = 1
+
+
+class PlanWriter(object):
+    """
+    Writes the decisions of a dry run as JSON lines: a header with the
+    directories and settings of the run, then one entry per file with its
+    size, modification time, date, target and action, and a trailer with
+    the number of entries. The file only appears under its name once the
+    run completed.
+    """
+
+    def __init__(self, path, input_dir, output_dir, signature):
+        self.path = os.path.expanduser(path)
+        self.temp = self.path + TEMP_SUFFIX
+        self.lock = threading.Lock()
+        self.entries = 0
+        self.file = open(self.temp, 'w')
+        self.write({
+            'plan': VERSION,
+            'input_dir': os.path.abspath(input_dir),
+            'output_dir': os.path.abspath(output_dir),
+            'signature': signature,
+        })
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+
+    def record(self, source, action, target=None, date=None, sidecars=(), reason=None,
+               duplicate=None):
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return
+        entry = {
+            'source': os.path.abspath(source),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'date': date.isoformat() if date is not None else None,
+            'action': action,
+        }
+        if target is not None:
+            entry['target'] = os.path.abspath(target)
+            entry['sidecars'] = [[os.path.abspath(original), os.path.abspath(xmp)]
+                                 for original, xmp in sidecars]
+        if reason is not None:
+            entry['reason'] = reason
+        if duplicate is not None:
+            entry['duplicate'] = os.path.abspath(duplicate)
+        with self.lock:
+            self.write(entry)
+            self.entries += 1
+
+    def close(self, completed):
+        """
+        Publish the plan of a completed run, or discard an unfinished one
+        """
+        with self.lock:
+            if not completed:
+                self.file.close()
+                os.remove(self.temp)
+                return
+            self.write({'end': self.entries})
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self.temp, self.path)
+
+
+def read_trailer(f):
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(max(0, size - 4096))
+    lines = f.read().splitlines()
+    try:
+        trailer = json.loads(lines[-1]) if lines else None
+    except ValueError:
+        return None
+    if not isinstance(trailer, dict) or 'end' not in trailer:
+        return None
+    return trailer['end']
+
+
+def read_plan(path):
+    """
+    Return the header of a plan and an iterator over its entries. Plans
+    without their trailer are incomplete and rejected.
+    """
+    path = os.path.expanduser(path)
+    f = open(path, 'rb')
+    try:
+        header = json.loads(f.readline() or b'null')
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('plan') != VERSION:
+        f.close()
+        raise RuntimeError(f"'{path}' is not a phockup plan")
+    expected = read_trailer(f)
+    if expected is None:
+        f.close()
+        raise RuntimeError(f"The plan '{path}' is incomplete")
+    f.seek(0)
+    f.readline()
+
+    def entries():
+        count = 0
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'end' in entry:
+                    break
+                count += 1
+                yield entry
+        if count != expected:
+            raise RuntimeError(f"The plan '{path}' has {count} of {expected} entries")
+    return header, entries()
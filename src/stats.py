@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.transfer import TEMP_SUFFIX
+
+COUNTERS = ('files_processed', 'duplicates_found', 'unknown_found', 'files_moved',
+            'files_copied', 'files_pending')
+
+
+class Histogram(object):
+    """
+    Distribution of the durations of a stage in logarithmic buckets, so the
+    memory stays constant however many files are processed. Percentiles are
+    accurate to about 5%.
+    """
+    BUCKETS_PER_DOUBLING = 16
+    SMALLEST = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+
+    def bucket(self, duration):
+        if duration <= self.SMALLEST:
+            return 0
+        return int(math.log2(duration / self.SMALLEST) * self.BUCKETS_PER_DOUBLING) + 1
+
+    def add(self, duration, size=0):
+        index = self.bucket(duration)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.bytes += size
+
+    def percentile(self, fraction):
+        """
+        The upper bound of the bucket holding the percentile, at most the
+        slowest duration
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = self.SMALLEST * 2 ** (index / self.BUCKETS_PER_DOUBLING)
+                return min(upper, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'p50': round(self.percentile(0.50), 6),
+            'p95': round(self.percentile(0.95), 6),
+            'p99': round(self.percentile(0.99), 6),
+            'max': round(self.max, 6),
+            'bytes': self.bytes,
+        }
+
+
+class RunStats(object):
+    """
+    Counters and per-stage timings of a run, shared by all workers. The
+    stages are only timed if timing is enabled.
+    """
+
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {}
+
+    def increment(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def get(self, counter):
+        return self.counters[counter]
+
+    def add(self, stage, duration, size=0):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.add(duration, size)
+
+    @contextmanager
+    def timer(self, stage, size=0):
+        """
+        Time the block as a stage. size is the number of bytes the stage
+        handles, if any.
+        """
+        if not self.timing:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, size)
+
+    def as_dict(self, run_time=None):
+        with self.lock:
+            return {
+                'run_time': round(run_time, 6) if run_time is not None else None,
+                'counters': dict(self.counters),
+                'stages': {stage: histogram.as_dict()
+                           for stage, histogram in sorted(self.stages.items())},
+            }
+
+    def write(self, path, run_time=None):
+        """
+        Write the stats as JSON, through a temporary file so a reader never
+        sees half of it
+        """
+        path = os.path.expanduser(path)
+        temp = path + TEMP_SUFFIX
+        with open(temp, 'w') as f:
+            json.dump(self.as_dict(run_time), f, indent=2)
+        os.replace(temp, path)
@@ -0,0 +1,260 @@
+import concurrent.futures
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('phockup')
+
+COPY_METHODS = ('auto', 'reflink', 'copy_file_range', 'sendfile', 'userspace')
+# Files are written under a temporary name and renamed once complete
+TEMP_SUFFIX = '.phockup-tmp'
+
+# ioctl request to share the data of a file copy-on-write on Linux
+FICLONE = 0x40049409
+CHUNK_SIZE = 64 * 1024 * 1024
+# Errors for methods the platform or filesystem does not support
+UNSUPPORTED = {
+    errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS,
+    errno.ENOTTY, errno.EBADF, errno.EPERM,
+}
+
+
+def temp_path(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}{TEMP_SUFFIX}')
+
+
+def drop_cache(fd):
+    """
+    Evict the synced pages of a file from the page cache, so it is read
+    back from the disk. Returns False where the platform cannot do that.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        return False
+    return True
+
+
+def fsync_directory(path):
+    """
+    Make a rename in the directory durable. Directories cannot be opened
+    on Windows, where renames need no sync.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def reflink(fsrc, fdst, size):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOSYS, 'reflink is not available')
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def copy_file_range(fsrc, fdst, size):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range is not available')
+    offset = 0
+    while True:
+        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), CHUNK_SIZE, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    if offset < size:
+        raise OSError(errno.EINVAL, 'copy_file_range copied no data')
+
+
+def sendfile(fsrc, fdst, size):
+    if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOSYS, 'sendfile is not available')
+    offset = 0
+    while True:
+        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, CHUNK_SIZE)
+        if sent == 0:
+            break
+        offset += sent
+    if offset < size:
+        raise OSError(errno.EINVAL, 'sendfile copied no data')
+
+
+def userspace(fsrc, fdst, size):
+    shutil.copyfileobj(fsrc, fdst)
+
+
+class FileCopier(object):
+    """
+    Copies files like shutil.copy2, but lets the kernel copy the data or
+    share it copy-on-write where the filesystems support it. Methods that
+    fail between two filesystems are not tried again for them.
+    """
+    METHODS = {
+        'reflink': reflink,
+        'copy_file_range': copy_file_range,
+        'sendfile': sendfile,
+        'userspace': userspace,
+    }
+
+    def __init__(self, method='auto'):
+        if method == 'auto':
+            self.methods = ['reflink', 'copy_file_range', 'sendfile']
+        elif method == 'userspace':
+            self.methods = []
+        else:
+            self.methods = [method]
+        self.lock = threading.Lock()
+        self.unsupported = set()
+
+    def copy(self, src, dst):
+        """
+        Copy the content and the metadata of src to dst. The copy is
+        written to a temporary file which is renamed to dst when complete.
+        """
+        temp = temp_path(dst)
+        try:
+            self.copy_file(src, temp)
+            os.replace(temp, dst)
+        except BaseException:
+            if os.path.lexists(temp):
+                os.remove(temp)
+            raise
+
+    def copy_file(self, src, dst):
+        if not self.methods:
+            shutil.copy2(src, dst)
+            return
+
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            stat = os.fstat(fsrc.fileno())
+            devices = (stat.st_dev, os.fstat(fdst.fileno()).st_dev)
+            for method in self.methods + ['userspace']:
+                with self.lock:
+                    if (method, devices) in self.unsupported:
+                        continue
+                try:
+                    self.METHODS[method](fsrc, fdst, stat.st_size)
+                    break
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED or method == 'userspace':
+                        raise
+                    logger.debug(f"Copy method {method} failed for {src}: {e}")
+                    with self.lock:
+                        self.unsupported.add((method, devices))
+                    # Start over with an empty file
+                    fsrc.seek(0)
+                    fdst.seek(0)
+                    fdst.truncate()
+        shutil.copystat(src, dst)
+
+
+class FileMover(object):
+    """
+    Moves files like shutil.move. Between filesystems the data is copied
+    and hashed in the same read, synced, dropped from the page cache, read
+    back from the disk and verified. The source is only removed once the
+    rename of the copy is synced too. Large files are copied in chunks by
+    several workers.
+    """
+    BLOCK_SIZE = 1024 * 1024
+    CHUNK_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def move(self, src, dst):
+        stat = os.lstat(src)
+        if os.path.islink(src) or self.same_device(stat, dst):
+            shutil.move(src, dst)
+            return
+
+        temp = temp_path(dst)
+        try:
+            self.copy_verified(src, temp, stat.st_size)
+            shutil.copystat(src, temp)
+            os.replace(temp, dst)
+        except BaseException:
+            if os.path.lexists(temp):
+                os.remove(temp)
+            raise
+        fsync_directory(os.path.dirname(os.path.abspath(dst)))
+        os.remove(src)
+
+    def same_device(self, stat, dst):
+        return stat.st_dev == os.stat(os.path.dirname(os.path.abspath(dst))).st_dev
+
+    def copy_verified(self, src, dst, size):
+        with open(dst, 'wb') as f:
+            f.truncate(size)
+        offsets = range(0, size, self.CHUNK_SIZE)
+        digests = self.map(lambda offset: self.copy_chunk(src, dst, offset), offsets)
+        with open(dst, 'rb+') as f:
+            os.fsync(f.fileno())
+            if not drop_cache(f.fileno()):
+                logger.debug(f"Cannot drop '{dst}' from the page cache, "
+                             "verifying the cached copy")
+        written = self.map(lambda offset: self.hash_chunk(dst, offset), offsets)
+        if written != digests:
+            raise OSError(errno.EIO, f"Verification of '{dst}' failed, '{src}' is kept")
+
+    def map(self, function, offsets):
+        if len(offsets) > 1 and self.workers > 1:
+            return list(self.get_executor().map(function, offsets))
+        return [function(offset) for offset in offsets]
+
+    def copy_chunk(self, src, dst, offset):
+        sha = hashlib.sha256()
+        with open(src, 'rb') as fsrc, open(dst, 'rb+') as fdst:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            remaining = self.CHUNK_SIZE
+            while remaining:
+                block = fsrc.read(min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                sha.update(block)
+                fdst.write(block)
+                remaining -= len(block)
+        return sha.digest()
+
+    def hash_chunk(self, filename, offset):
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            remaining = self.CHUNK_SIZE
+            while remaining:
+                block = f.read(min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                sha.update(block)
+                remaining -= len(block)
+        return sha.digest()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
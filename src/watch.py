@@ -0,0 +1,137 @@
+import ctypes
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger('phockup')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct('iIII')
+
+
+class DirectoryWatcher(object):
+    """
+    Watches a directory tree with inotify and returns the files written or
+    moved into it, once their size stopped changing for settle_time seconds.
+    New directories are watched as well, down to stop_depth.
+    """
+    SETTLE_TIME = 2.0
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, root, stop_depth=sys.maxsize, settle_time=None):
+        if not sys.platform.startswith('linux'):
+            raise RuntimeError("Watching a directory requires inotify (Linux)")
+        # The functions of the running process, so musl (Alpine) works like glibc
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Cannot initialize inotify")
+        self.root = root
+        self.stop_depth = stop_depth
+        self.settle_time = self.SETTLE_TIME if settle_time is None else settle_time
+        self.watches = {}
+        self.pending = {}
+        self.add_tree(root, initial=True)
+
+    def add_tree(self, path, initial=False):
+        """
+        Watch path and its subdirectories. Files already in a directory that
+        was created or moved in are pending as well.
+        """
+        for root, dirnames, files in os.walk(path):
+            self.add_watch(root)
+            if not initial:
+                for filename in files:
+                    self.add_pending(os.path.join(root, filename))
+            if root.count(os.sep) >= self.stop_depth:
+                del dirnames[:]
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            logger.warning(f"Cannot watch '{path}': {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = path
+
+    def add_pending(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self.pending[path] = (size, time.monotonic())
+
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Missed file system events, scanning the input directory again")
+                self.add_tree(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and directory.count(os.sep) < self.stop_depth:
+                    self.add_tree(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.add_pending(path)
+
+    def settled(self):
+        """
+        Return the pending files whose size did not change for settle_time
+        """
+        now = time.monotonic()
+        ready = []
+        for path, (size, since) in list(self.pending.items()):
+            try:
+                current = os.path.getsize(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != size:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_time:
+                del self.pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def batches(self):
+        """
+        Yield the lists of settled files until interrupted
+        """
+        while True:
+            self.read_events(self.POLL_INTERVAL if self.pending else None)
+            ready = self.settled()
+            if ready:
+                yield ready
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import os
+
+from benchmarks.corpus import CorpusConfig, generate
+from benchmarks.run import MODES, main, media_files, parse_args
+from src.native import NativeExif
+
+
+def read_tree(root):
+    contents = {}
+    for directory, dirnames, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as f:
+                contents[os.path.relpath(path, root)] = f.read()
+    return contents
+
+
+def test_corpus_is_reproducible(tmp_path):
+    config = CorpusConfig(files=30, min_size=1024, max_size=4096, depth=1)
+    first = generate(str(tmp_path / 'first'), config)
+    second = generate(str(tmp_path / 'second'), config)
+    assert first == second
+    assert first['files'] == 30
+    assert first['directories'] == 5
+    assert read_tree(str(tmp_path / 'first')) == read_tree(str(tmp_path / 'second'))
+
+
+def test_corpus_files_have_dates(tmp_path):
+    config = CorpusConfig(files=20, min_size=1024, max_size=4096, no_date_ratio=0, video_ratio=0.5)
+    generate(str(tmp_path), config)
+    for filename in media_files(str(tmp_path)):
+        data = NativeExif(filename).data()
+        assert data['CreateDate'] != '0000:00:00 00:00:00'
+
+
+def test_benchmark_writes_results(tmp_path):
+    output = str(tmp_path / 'results.json')
+    report = main(parse_args(['--files', '20', '--min-size', '1024', '--max-size', '4096',
+                              '--concurrency', '1', '2', '--native-exif',
+                              '--workdir', str(tmp_path / 'work'), '--output', output]))
+    assert os.path.isfile(output)
+    runs = [r for r in report['results'] if r['name'] == 'run']
+    assert sorted({r['mode'] for r in runs}) == sorted(MODES)
+    assert len(runs) == 2 * len(MODES)
+    assert all(r['files'] == report['corpus']['files'] for r in runs)
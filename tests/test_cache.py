@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import os
+import shutil
+from datetime import datetime
+
+from src.cache import MetadataCache
+from src.exif import Exif
+from src.phockup import Phockup
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_cache_stores_exif_and_date(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+    date = {'date': datetime(2017, 1, 1, 1, 1, 1), 'subseconds': '20'}
+    cache.put('input/exif.jpg', {'MIMEType': 'image/jpeg'}, '[]', date)
+    entry = cache.get('input/exif.jpg')
+    assert entry == {'exif': {'MIMEType': 'image/jpeg'}, 'date_options': '[]', 'date': date}
+    assert cache.contains('input/exif.jpg')
+    assert cache.get('input/xmp.jpg') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_ignores_changed_file(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'cache.sqlite'))
+    filename = str(tmp_path / 'changed.jpg')
+    with open(filename, 'w') as f:
+        f.write('a')
+    cache.put(filename, {'MIMEType': 'image/jpeg'})
+    assert cache.get(filename) is not None
+    with open(filename, 'w') as f:
+        f.write('ab')
+    assert cache.get(filename) is None
+    assert not cache.contains(filename)
+
+
+def test_cache_evicts_unseen_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = MetadataCache(path)
+    cache.put('input/exif.jpg', {'MIMEType': 'image/jpeg'})
+    cache.put('input/xmp.jpg', {'MIMEType': 'image/jpeg'})
+    cache.commit()
+
+    cache = MetadataCache(path)
+    assert cache.get('input/exif.jpg') is not None
+    cache.evict('input/sub_folder')
+    assert cache.stats()['evicted'] == 0
+    cache.evict('input')
+    assert cache.stats()['evicted'] == 1
+    assert cache.contains('input/exif.jpg')
+    assert not cache.contains('input/xmp.jpg')
+
+
+def test_phockup_uses_cache(mocker, tmp_path):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    cache = str(tmp_path / 'cache.sqlite')
+    phockup = Phockup('input', 'output', cache=cache)
+    phockup.process_file("input/date_20170101_010101.jpg")
+    phockup.cache.commit()
+    assert Exif.data.call_count == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+    Phockup('input', 'output', cache=cache).process_file("input/date_20170101_010101.jpg")
+    assert Exif.data.call_count == 1
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    shutil.rmtree('output', ignore_errors=True)
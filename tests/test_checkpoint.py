@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+
+import pytest
+
+from src.checkpoint import Checkpoint
+from src.exif import Exif
+from src.phockup import Phockup
+from src.transfer import TEMP_SUFFIX
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_checkpoint_tracks_directories(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), 'input')
+    files = ['input/a.jpg', 'input/b.jpg', 'input/b.xmp']
+    assert checkpoint.pending('input', files) == files
+    checkpoint.done('input/a.jpg')
+    assert checkpoint.done_files == {'.': {'a.jpg'}}
+    checkpoint.save()
+
+    resumed = Checkpoint(str(tmp_path), 'input')
+    assert resumed.load()
+    assert resumed.pending('input', files) == ['input/b.jpg', 'input/b.xmp']
+    resumed.done('input/b.jpg')
+    assert resumed.done_dirs == {'.'}
+    assert resumed.pending('input', files) == ['input/b.xmp']
+    assert not Checkpoint(str(tmp_path), 'other').load()
+
+
+def test_checkpoint_locks_input(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), 'input')
+    assert checkpoint.acquire()
+    assert not Checkpoint(str(tmp_path), 'input').acquire()
+    other = Checkpoint(str(tmp_path), 'other')
+    assert other.path != checkpoint.path
+    assert not Checkpoint.others_running(str(tmp_path), checkpoint.lock_path)
+    assert other.acquire()
+    assert Checkpoint.others_running(str(tmp_path), checkpoint.lock_path)
+    other.remove()
+    assert not os.path.exists(other.lock_path)
+    assert not Checkpoint.others_running(str(tmp_path), checkpoint.lock_path)
+    checkpoint.release()
+    assert Checkpoint(str(tmp_path), 'input').acquire()
+
+
+def test_checkpoint_stops_tracking_when_watching(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), 'input')
+    checkpoint.pending('input', ['input/a.jpg', 'input/b.jpg'])
+    checkpoint.done('input/a.jpg')
+    checkpoint.watch()
+    checkpoint.done('input/b.jpg')
+    checkpoint.save()
+    with open(checkpoint.path) as f:
+        state = json.load(f)
+    assert state['done_dirs'] == []
+    assert state['done_files'] == {}
+
+
+def test_checkpoint_removes_temp_files(tmp_path):
+    os.mkdir(str(tmp_path / '2017'))
+    temp = str(tmp_path / '2017' / f'.photo.jpg{TEMP_SUFFIX}')
+    with open(temp, 'w') as f:
+        f.write('half')
+    Checkpoint.remove_temp_files(str(tmp_path))
+    assert not os.path.exists(temp)
+
+
+def test_phockup_resumes_interrupted_run(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    process_file = Phockup.process_file
+    processed = []
+
+    def interrupt(self, filename):
+        if len(processed) == 3:
+            raise KeyboardInterrupt
+        processed.append(filename)
+        process_file(self, filename)
+
+    mocker.patch.object(Phockup, 'process_file', interrupt)
+    Phockup('input', 'output')
+    assert os.path.isfile(Checkpoint('output', 'input').path)
+
+    mocker.patch.object(Phockup, 'process_file', process_file)
+    phockup = Phockup('input', 'output', resume=True)
+    expected = sum(1 for root, dirnames, files in os.walk('input')
+                   for f in files if not f.endswith('.xmp'))
+    assert phockup.files_processed == expected - 3
+    assert not os.path.exists(Checkpoint('output', 'input').path)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_phockup_cleans_up_after_early_crash(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    # The run crashes long before the checkpoint would be saved regularly
+    mocker.patch.object(Checkpoint, 'save')
+    mocker.patch.object(Phockup, 'walk_directory', side_effect=RuntimeError('crash'))
+    with pytest.raises(RuntimeError):
+        Phockup('input', 'output')
+    assert os.path.isfile(Checkpoint('output', 'input').path)
+    os.makedirs(os.path.join('output', '2017'))
+    temp = os.path.join('output', '2017', f'.photo.jpg{TEMP_SUFFIX}')
+    with open(temp, 'w') as f:
+        f.write('half')
+
+    mocker.stopall()
+    mocker.patch.object(Exif, 'data', return_value={"MIMEType": "image/jpeg"})
+    Phockup('input', 'output')
+    assert not os.path.exists(temp)
+    assert not os.path.exists(Checkpoint('output', 'input').path)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_phockup_keeps_temp_files_of_other_runs(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data', return_value={"MIMEType": "image/jpeg"})
+    os.makedirs(os.path.join('output', '2017'))
+    # A crashed run from this input and a running one from another input
+    with open(Checkpoint('output', 'input').path, 'w') as f:
+        f.write('{}')
+    temp = os.path.join('output', '2017', f'.photo.jpg{TEMP_SUFFIX}')
+    with open(temp, 'w') as f:
+        f.write('half')
+    running = Checkpoint('output', 'input/sub_folder')
+    assert running.acquire()
+    with pytest.raises(RuntimeError, match='in progress'):
+        Phockup('input/sub_folder', 'output')
+    Phockup('input', 'output')
+    assert os.path.isfile(temp)
+    running.remove()
+    shutil.rmtree('output', ignore_errors=True)
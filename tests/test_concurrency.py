@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+from src.concurrency import AdaptiveLimiter
+
+
+def feed(limiter, start, throughput, latency):
+    """Record one window with the given files/second and seconds/file"""
+    count = int(throughput * limiter.WINDOW)
+    for i in range(1, count + 1):
+        limiter.record(latency, start + i * limiter.WINDOW / count)
+    return start + limiter.WINDOW
+
+
+def test_limiter_grows_while_throughput_improves():
+    limiter = AdaptiveLimiter('test', 8, clock=lambda: 0.0)
+    now = 0.0
+    for throughput in (10, 20, 30, 40):
+        now = feed(limiter, now, throughput, 0.1)
+    assert limiter.limit == 5
+    assert limiter.chosen == 4
+
+
+def test_limiter_turns_around_when_throughput_drops():
+    limiter = AdaptiveLimiter('test', 8, clock=lambda: 0.0)
+    now = 0.0
+    for throughput in (10, 20, 30, 20):
+        now = feed(limiter, now, throughput, 0.1)
+    assert limiter.limit == 3
+    assert limiter.chosen == 3
+
+
+def test_limiter_halves_when_latency_grows():
+    limiter = AdaptiveLimiter('test', 8, initial=6, clock=lambda: 0.0)
+    now = feed(limiter, 0.0, 10, 0.1)
+    now = feed(limiter, now, 10, 0.5)
+    assert limiter.limit == 3
+
+
+def test_limiter_stays_within_bounds():
+    limiter = AdaptiveLimiter('test', 2, clock=lambda: 0.0)
+    now = 0.0
+    for throughput in (10, 20, 30, 40):
+        now = feed(limiter, now, throughput, 0.1)
+    assert 1 <= limiter.limit <= 2
+    assert limiter.run(lambda item: item * 2, 21) == 42
+    assert limiter.active == 0
@@ -3,7 +3,9 @@ import os
 import re
 from datetime import datetime
 
-from src.date import Date
+import pytest
+
+from src.date import Date, FilenameMatcher
 
 os.chdir(os.path.dirname(__file__))
 
@@ -89,6 +91,31 @@ def test_get_date_from_exif_invalid():
            }
 
 
+def test_from_datestring_fast_path_matches_strptime():
+    datestrings = [
+        "2017:01:01 01:01:01", "2017-12-31 23:59:59", "2017:01:01 01:01:01+02:00",
+        "2017:01:01 01:01:01.123-05:00", "2017:01:01 01:01:01.12.34", "2017:1:1 1:1:1",
+        "2017:01:01+02:00 01:01:01", "2017:01-01 01:01:01", "2017:02:29 01:01:01",
+        "2017:01:01 24:00:00", "2017:01:01 01:01:60", "2017:01:01 01:01:01\n",
+        "2017:01:01 01:01:01.+01:00+02:00",
+    ]
+    for datestring in datestrings:
+        date, _, subseconds = datestring.partition('.')
+        date = re.sub(r'(.*)([+-]\d{2}:\d{2})', r'\1', date)
+        expected = None
+        for date_format in ('%Y:%m:%d %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+            try:
+                expected = datetime.strptime(date, date_format)
+                break
+            except ValueError:
+                pass
+        subseconds = re.sub(r'(.*)([+-]\d{2}:\d{2})', r'\1', subseconds.partition('.')[0])
+        assert Date.from_datestring(datestring) == {
+            "date": expected,
+            "subseconds": subseconds
+        }, datestring
+
+
 def test_get_date_from_filename():
     assert Date("IMG_20170101_010101.jpg").from_exif({}) == {
         "date": datetime(2017, 1, 1, 1, 1, 1),
@@ -147,3 +174,30 @@ def test_get_date_custom_regex_optional_time():
         "date": datetime(2015, 1, 27, 0, 0, 00),
         "subseconds": ""
     }
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ("PXL_20230101_123456789.jpg", datetime(2023, 1, 1, 12, 34, 56)),
+    ("20230102_123456.jpg", datetime(2023, 1, 2, 12, 34, 56)),
+    ("IMG-20230103-WA0001.jpg", datetime(2023, 1, 3)),
+    ("WhatsApp Image 2023-01-04 at 12.34.56.jpeg", datetime(2023, 1, 4, 12, 34, 56)),
+    ("signal-2023-01-05-12-34-56-789.jpg", datetime(2023, 1, 5, 12, 34, 56)),
+    ("Screenshot 2023-01-06 at 12.34.56.png", datetime(2023, 1, 6, 12, 34, 56)),
+    ("Scan_20230107.jpg", datetime(2023, 1, 7)),
+])
+def test_get_date_from_filename_patterns(filename, expected):
+    assert Date(filename).from_exif({}) == {
+        "date": expected,
+        "subseconds": ""
+    }
+
+
+def test_filename_matcher_selected_patterns():
+    matcher = FilenameMatcher(['whatsapp', 'default'])
+    assert matcher.match("IMG-20230103-WA0001.jpg") == {
+        "year": "2023", "month": "01", "day": "03", "hour": "0", "minute": "0", "second": "0"
+    }
+    assert matcher.match("20230102_123456.jpg") is None
+    assert Date("20230102_123456.jpg").from_exif({}, filename_matcher=matcher) is None
+    with pytest.raises(ValueError):
+        FilenameMatcher(['unknown'])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from src.duplicate import ContentIndex, FileHasher
+
+os.chdir(os.path.dirname(__file__))
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def test_hasher_memoizes_digest(mocker):
+    hasher = FileHasher()
+    digest = hasher.digest('input/exif.jpg')
+    mocker.patch('builtins.open', side_effect=AssertionError('file read twice'))
+    assert hasher.digest('input/exif.jpg') == digest
+    assert hasher.partial_digest('input/exif.jpg') == digest
+
+
+def test_hasher_rehashes_changed_file(tmp_path):
+    hasher = FileHasher()
+    path = write(str(tmp_path / 'a.jpg'), 'a')
+    digest = hasher.digest(path)
+    write(path, 'ab')
+    assert hasher.digest(path) != digest
+
+
+def test_hasher_same_compares_in_stages(mocker, tmp_path):
+    mocker.patch.object(FileHasher, 'PARTIAL_SIZE', 4)
+    hasher = FileHasher()
+    first = write(str(tmp_path / 'first.mp4'), 'head-middle-tail')
+    second = write(str(tmp_path / 'second.mp4'), 'head-MIDDLE-tail')
+    third = write(str(tmp_path / 'third.mp4'), 'HEAD-middle-tail')
+    copy = write(str(tmp_path / 'copy.mp4'), 'head-middle-tail')
+    shorter = write(str(tmp_path / 'shorter.mp4'), 'head-tail')
+    mocker.spy(hasher, 'hash_file')
+    assert not hasher.same(first, shorter)
+    assert not hasher.same(first, third)
+    assert hasher.hash_file.call_count == 0
+    assert not hasher.same(first, second)
+    assert hasher.same(first, copy)
+    # first is read completely only once
+    assert hasher.hash_file.call_count == 3
+
+
+def test_hasher_carries_digests_to_copy(mocker, tmp_path):
+    hasher = FileHasher()
+    source = write(str(tmp_path / 'source.jpg'), 'content')
+    other = write(str(tmp_path / 'other.jpg'), 'content')
+    digest = hasher.digest(source)
+    copy = str(tmp_path / 'copy.jpg')
+    shutil.copy2(source, copy)
+    moved = str(tmp_path / 'moved.jpg')
+    os.rename(source, moved)
+    hasher.carry(source, copy)
+    hasher.carry(source, moved, forget=True)
+    assert source not in hasher.digests
+    hashed = mocker.spy(hasher, 'hash_file')
+    assert hasher.digest(copy) == digest
+    assert hasher.digest(moved) == digest
+    assert hasher.same(other, copy)
+    # Only the other file is read
+    assert [call.args[0] for call in hashed.call_args_list] == [other]
+
+    changed = str(tmp_path / 'changed.jpg')
+    write(changed, 'altered')
+    hasher.carry(copy, changed)
+    assert hasher.digest(changed) != digest
+
+
+def test_content_index_finds_file_with_other_name(tmp_path):
+    write(str(tmp_path / 'output/2017/01/01/20170101-010101.jpg'), 'same')
+    write(str(tmp_path / 'output/2017/01/01/20170101-010102.jpg'), 'diff')
+    source = write(str(tmp_path / 'input/IMG_0001.jpg'), 'same')
+    other = write(str(tmp_path / 'input/IMG_0002.jpg'), 'other content')
+    index = ContentIndex(str(tmp_path / 'output'), FileHasher())
+    assert index.find(source) == str(tmp_path / 'output/2017/01/01/20170101-010101.jpg')
+    assert index.find(other) is None
+    assert index.find(str(tmp_path / 'input/missing.jpg')) is None
+
+
+def test_content_index_add_compares_with_content(tmp_path):
+    source = write(str(tmp_path / 'input/IMG_0001.jpg'), 'same')
+    index = ContentIndex(str(tmp_path / 'output'), FileHasher())
+    assert index.find(source) is None
+    # The target does not exist (dry run), so the source is compared
+    index.add(str(tmp_path / 'output/IMG_0001.jpg'), 4, source)
+    copy = write(str(tmp_path / 'input/IMG_0002.jpg'), 'same')
+    assert index.find(copy) == str(tmp_path / 'output/IMG_0001.jpg')
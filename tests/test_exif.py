@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
+import io
 import os
+import queue
 from subprocess import CalledProcessError
 
-from src.exif import Exif
+from src.exif import (Exif, ExifTool, ExifToolError, ExifToolPool,
+                      ExifToolTimeout)
 
 os.chdir(os.path.dirname(__file__))
 
@@ -27,3 +30,70 @@ def test_exif_handles_exception(mocker):
                  side_effect=CalledProcessError(2, 'cmd'))
     exif = Exif("not-existing.jpg")
     assert exif.data() is None
+
+
+def test_exif_pool_reads_valid_file():
+    pool = ExifToolPool()
+    assert Exif("input/exif.jpg", pool).data()['CreateDate'] == '2017:01:01 01:01:01'
+    assert Exif("input/phockup's exif test.jpg", pool).data()['CreateDate'] == '2017:01:01 01:01:01'
+    pool.close()
+
+
+def test_exif_pool_handles_missing_file():
+    pool = ExifToolPool()
+    assert Exif("not-existing.jpg", pool).data() is None
+    pool.close()
+
+
+def test_exif_pool_restarts_crashed_process(mocker):
+    mocker.patch.object(ExifTool, 'execute', side_effect=[
+        ExifToolError('exiftool exited unexpectedly'),
+        b'[{"CreateDate": "2017:01:01 01:01:01"}]',
+    ])
+    pool = ExifToolPool()
+    assert pool.data("input/exif.jpg")['CreateDate'] == '2017:01:01 01:01:01'
+    assert ExifTool.execute.call_count == 2
+
+
+def test_exif_pool_does_not_retry_hanging_process(mocker):
+    mocker.patch.object(ExifTool, 'execute', side_effect=ExifToolTimeout('timeout'))
+    pool = ExifToolPool()
+    assert pool.data("input/exif.jpg") is None
+    assert ExifTool.execute.call_count == 1
+
+
+def test_exif_pool_batch_data(mocker):
+    mocker.patch.object(ExifTool, 'execute', return_value=b"""[
+        {"SourceFile": "input/exif.jpg", "CreateDate": "2017:01:01 01:01:01"},
+        {"SourceFile": "input/xmp.jpg", "CreateDate": "2017:01:01 01:01:01"}
+    ]""")
+    pool = ExifToolPool()
+    data = pool.batch_data(["input/exif.jpg", "input/not-existing.jpg", "input/xmp.jpg"])
+    assert set(data) == {"input/exif.jpg", "input/xmp.jpg"}
+    assert data["input/xmp.jpg"]['SourceFile'] == "input/xmp.jpg"
+
+
+def test_exif_pool_batch_timeout_scales(mocker):
+    mocker.patch.object(ExifTool, 'execute', return_value=b'[]')
+    pool = ExifToolPool(timeout=10)
+    pool.batch_data(["input/exif.jpg", "input/xmp.jpg", "input/other.txt"])
+    assert ExifTool.execute.call_args.kwargs['timeout'] == 30
+    pool.data("input/exif.jpg")
+    assert ExifTool.execute.call_args.kwargs['timeout'] is None
+
+
+def test_exif_pool_passes_undecodable_names(mocker):
+    name = 'input/caf\udce9.jpg'
+    stdin = io.BytesIO()
+
+    def start(self):
+        self.process = mocker.Mock(stdin=stdin, poll=mocker.Mock(return_value=None))
+        self.lines = queue.Queue()
+        self.lines.put(b'[{"SourceFile": "input/caf\xe9.jpg", "CreateDate": "2017:01:01 01:01:01"}]\n')
+        self.lines.put(b'{ready1}\n')
+
+    mocker.patch.object(ExifTool, 'start', start)
+    pool = ExifToolPool()
+    data = pool.batch_data([name])
+    assert data[name]['CreateDate'] == '2017:01:01 01:01:01'
+    assert b'\ninput/caf\xe9.jpg\n' in stdin.getvalue()
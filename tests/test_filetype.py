@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+import pytest
+
+from src.exif import Exif, ExifToolPool
+from src.filetype import classify, extension_mimetype
+from src.phockup import Phockup
+
+os.chdir(os.path.dirname(__file__))
+
+
+@pytest.mark.parametrize('filename, header, expected', [
+    ('photo.jpg', b'\xff\xd8\xff\xe1\x00\x10Exif', 'image'),
+    ('photo.dat', b'\x89PNG\r\n\x1a\n\x00\x00', 'image'),
+    ('photo.heic', b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00', 'image'),
+    ('raw.cr3', b'\x00\x00\x00\x18ftypcrx \x00\x00\x00\x01', 'image'),
+    ('photo.webp', b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'image'),
+    ('clip.mp4', b'\x00\x00\x00\x20ftypisom\x00\x00\x02\x00', 'video'),
+    ('clip.mov', b'\x00\x00\x00\x08wide\x00\x00\x00\x00', 'video'),
+    ('clip.mkv', b'\x1aE\xdf\xa3\x01\x00\x00\x00', 'video'),
+    ('sound.mka', b'\x1aE\xdf\xa3\x01\x00\x00\x00', None),
+    ('song.m4a', b'\x00\x00\x00\x20ftypM4A \x00\x00\x00\x00', 'other'),
+    ('document.pdf', b'%PDF-1.7\n', 'other'),
+    ('archive.bin', b'PK\x03\x04\x14\x00', 'other'),
+    ('notes.txt', b'Hello world', 'other'),
+    ('photo.jpg', b'Hello world', None),
+    ('unknown.xyz', b'\x00\x01\x02\x03', None),
+])
+def test_classify(tmp_path, filename, header, expected):
+    path = tmp_path / filename
+    path.write_bytes(header)
+    assert classify(str(path)) == expected
+
+
+def test_extension_mimetype():
+    assert extension_mimetype('IMG_0001.JPG') == 'image/jpeg'
+    assert extension_mimetype('clip.mov') == 'video/quicktime'
+    assert extension_mimetype('notes.txt') is None
+
+
+def test_prefilter_skips_exiftool(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "video/mp4",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    phockup = Phockup('input', 'output', file_type='video')
+    phockup.process_file('input/exif.jpg')
+    phockup.process_file('input/other.txt')
+    Exif.data.assert_not_called()
+    assert not os.path.exists('output/2017')
+    assert not os.path.exists('output/unknown/other.txt')
+    phockup.process_file('input/exif.mp4')
+    Exif.data.assert_called_once()
+    assert os.path.isfile('output/2017/01/01/20170101-010101.mp4')
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_get_kind_trusts_media_extensions(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    classified = mocker.patch('src.phockup.classify', return_value='other')
+    phockup = Phockup('input', 'output')
+    assert phockup.get_kind('input/exif.jpg') is None
+    classified.assert_not_called()
+    assert phockup.get_kind('input/other.txt') == 'other'
+    assert Phockup('input', 'output', file_type='video').get_kind('input/exif.jpg') == 'other'
+
+
+def test_batch_classifies_files_once(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(ExifToolPool, 'batch_data', return_value={})
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "video/mp4",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    classified = mocker.patch('src.phockup.classify', wraps=classify)
+    phockup = Phockup('input', 'output', file_type='video', exif_batch_size=3)
+    chunk = ['input/exif.jpg', 'input/other.txt', 'input/exif.mp4']
+    phockup.process_chunk(chunk)
+    assert sorted(call.args[0] for call in classified.call_args_list) == sorted(chunk)
+    assert phockup.kinds == {}
+    assert os.path.isfile('output/2017/01/01/20170101-010101.mp4')
+    shutil.rmtree('output', ignore_errors=True)
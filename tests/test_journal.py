@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+import pytest
+
+from src.exif import Exif
+from src.journal import RunJournal
+from src.phockup import Phockup
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_journal_records_unchanged_files(tmp_path):
+    filename = str(tmp_path / 'photo.jpg')
+    with open(filename, 'w') as f:
+        f.write('a')
+    journal = RunJournal(str(tmp_path / 'journal.sqlite'), 'settings')
+    assert not journal.seen(filename)
+    journal.record(filename, RunJournal.identity(filename), 'copied')
+    assert journal.seen(filename)
+    assert not RunJournal(str(tmp_path / 'journal.sqlite'), 'other settings').seen(filename)
+    with open(filename, 'w') as f:
+        f.write('ab')
+    assert not journal.seen(filename)
+    assert journal.skipped == 1
+
+
+def test_journal_records_directories(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.sqlite'), 'settings')
+    assert journal.unchanged_directory('input', 1) is None
+    journal.record_directories({'input': (1, ['sub_folder'])})
+    assert journal.unchanged_directory('input', 1) == ['sub_folder']
+    assert journal.unchanged_directory('input', 2) is None
+
+
+def test_phockup_skips_journaled_files(mocker, tmp_path):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    journal = str(tmp_path / 'journal.sqlite')
+    Phockup('input', 'output', journal=journal)
+    calls = Exif.data.call_count
+    assert calls > 0
+    shutil.rmtree('output', ignore_errors=True)
+
+    phockup = Phockup('input', 'output', journal=journal)
+    assert Exif.data.call_count == calls
+    assert phockup.files_processed == 0
+    assert not os.path.isdir('output/unknown')
+
+    Phockup('input', 'output', journal=journal, original_filenames=True)
+    assert Exif.data.call_count == 2 * calls
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_phockup_skips_unchanged_directories(mocker, tmp_path):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    journal = str(tmp_path / 'journal.sqlite')
+    Phockup('input', 'output', journal=journal, since_journal=True)
+    scandir = mocker.spy(os, 'scandir')
+    Phockup('input', 'output', journal=journal, since_journal=True)
+    # Only the output directories are listed to reserve names
+    assert not [call for call in scandir.call_args_list if call[0][0].startswith('input')]
+    shutil.rmtree('output', ignore_errors=True)
+
+    with pytest.raises(RuntimeError):
+        Phockup('input', 'output', since_journal=True)
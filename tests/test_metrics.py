@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import time
+
+from src.exif import Exif
+from src.metrics import MetricsWriter, render
+from src.phockup import Phockup
+from src.stats import RunStats
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_render():
+    stats = RunStats(timing=True)
+    stats.increment('files_copied', 2)
+    stats.increment('files_pending', 3)
+    stats.add('copy', 0.5, 100)
+    stats.add('move', 0.25, 50)
+    text = render(stats.as_dict(), 1.5, running=True)
+    lines = text.splitlines()
+    assert '# TYPE phockup_files_copied_total counter' in lines
+    assert 'phockup_files_copied_total 2' in lines
+    assert 'phockup_files_pending 3' in lines
+    assert 'phockup_bytes_transferred_total 150' in lines
+    assert 'phockup_stage_duration_seconds{stage="copy",quantile="0.5"} 0.5' in lines
+    assert 'phockup_stage_duration_seconds_count{stage="move"} 1' in lines
+    assert 'phockup_run_duration_seconds 1.5' in lines
+    assert 'phockup_run_in_progress 1' in lines
+
+
+def test_writer_writes_regularly(tmp_path):
+    path = str(tmp_path / 'phockup.prom')
+    writer = MetricsWriter(path, RunStats(), interval=0.01)
+    writer.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with open(path) as f:
+        assert 'phockup_run_in_progress 1' in f.read()
+    writer.stop()
+    with open(path) as f:
+        assert 'phockup_run_in_progress 0' in f.read()
+    assert os.listdir(str(tmp_path)) == ['phockup.prom']
+
+
+def test_metrics_file(mocker, tmp_path):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    path = str(tmp_path / 'phockup.prom')
+    phockup = Phockup('input', 'output', metrics_file=path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert f'phockup_files_processed_total {phockup.files_processed}' in lines
+    assert 'phockup_files_pending 0' in lines
+    assert 'phockup_run_in_progress 0' in lines
+    shutil.rmtree('output', ignore_errors=True)
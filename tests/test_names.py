@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import os
+import threading
+
+from src.names import NameRegistry
+
+
+def write(tmp_path, name, content):
+    path = str(tmp_path / name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def same_content(source):
+    def is_duplicate(content):
+        with open(source) as f, open(content) as g:
+            return f.read() == g.read()
+    return is_duplicate
+
+
+def test_registry_reserves_free_names(tmp_path):
+    write(tmp_path, 'a.jpg', 'one')
+    write(tmp_path, 'a-2.jpg', 'two')
+    source = write(tmp_path, 'source', 'three')
+    registry = NameRegistry()
+    reservation = registry.reserve(str(tmp_path / 'a.jpg'), source, same_content(source))
+    assert reservation.path == str(tmp_path / 'a-3.jpg')
+    assert reservation.suffix == 3
+    registry.release(reservation, False)
+    assert registry.reserve(str(tmp_path / 'a.jpg'), source, same_content(source)).suffix == 3
+
+
+def test_registry_finds_duplicates(tmp_path):
+    write(tmp_path, 'a.jpg', 'one')
+    write(tmp_path, 'a-2.jpg', 'two')
+    source = write(tmp_path, 'source', 'two')
+    reservation = NameRegistry().reserve(str(tmp_path / 'a.jpg'), source, same_content(source))
+    assert reservation.duplicate == str(tmp_path / 'a-2.jpg')
+
+
+def test_registry_skips_dangling_links(tmp_path):
+    os.symlink(str(tmp_path / 'missing.jpg'), str(tmp_path / 'a.jpg'))
+    source = write(tmp_path, 'source', 'one')
+    reservation = NameRegistry().reserve(str(tmp_path / 'a.jpg'), source, same_content(source))
+    assert reservation.duplicate is None
+    assert reservation.path == str(tmp_path / 'a-2.jpg')
+
+
+def test_registry_lists_directory_once(tmp_path, mocker):
+    scandir = mocker.spy(os, 'scandir')
+    registry = NameRegistry()
+    source = write(tmp_path, 'source', 'one')
+    for _ in range(3):
+        reservation = registry.reserve(str(tmp_path / 'a.jpg'), source, lambda content: False)
+        registry.release(reservation, True)
+    assert scandir.call_count == 1
+    assert reservation.suffix == 3
+
+
+def test_registry_reuses_removed_names(tmp_path):
+    moved = write(tmp_path, 'a.jpg', 'one')
+    source = write(tmp_path, 'source', 'two')
+    registry = NameRegistry()
+    registry.names(str(tmp_path))
+    os.remove(moved)
+    assert registry.reserve(moved, source, same_content(source)).suffix == 1
+
+
+def test_registry_concurrent_reservations(tmp_path):
+    registry = NameRegistry()
+    reservations = []
+    lock = threading.Lock()
+
+    def reserve(i):
+        source = write(tmp_path, f'source{i}', str(i))
+        reservation = registry.reserve(str(tmp_path / 'out' / 'a.jpg'), source, same_content(source))
+        with lock:
+            reservations.append(reservation)
+        registry.release(reservation, True)
+
+    threads = [threading.Thread(target=reserve, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(r.suffix for r in reservations) == list(range(1, 21))
+
+
+def test_registry_ignores_case(tmp_path):
+    existing = write(tmp_path, 'IMG_0001.jpg', 'one')
+    first = write(tmp_path, 'first', 'two')
+    second = write(tmp_path, 'second', 'one')
+    registry = NameRegistry()
+    reservation = registry.reserve(str(tmp_path / 'img_0001.JPG'), first, same_content(first))
+    assert reservation.path == str(tmp_path / 'img_0001-2.JPG')
+    registry.release(reservation, False)
+    duplicate = registry.reserve(str(tmp_path / 'img_0001.JPG'), second, same_content(second))
+    assert duplicate.duplicate == existing
+    # Names found in the directory do not need a reservation each
+    assert registry.directories[str(tmp_path)].reserved == {}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import os
+import struct
+
+from src.native import NativeExif
+
+os.chdir(os.path.dirname(__file__))
+
+
+def build_ifd(tags, offset, pointer=None):
+    """Big-endian IFD with ASCII tags and an optional Exif IFD pointer"""
+    entries = sorted(tags.items())
+    count = len(entries) + (1 if pointer is not None else 0)
+    data_offset = offset + 2 + count * 12 + 4
+    table = b''
+    data = b''
+    for tag, value in entries:
+        value = value.encode() + b'\x00'
+        if len(value) <= 4:
+            table += struct.pack('>HHI', tag, 2, len(value)) + value.ljust(4, b'\x00')
+        else:
+            table += struct.pack('>HHII', tag, 2, len(value), data_offset + len(data))
+            data += value
+    if pointer is not None:
+        table += struct.pack('>HHII', 0x8769, 4, 1, pointer)
+    return struct.pack('>H', count) + table + b'\x00\x00\x00\x00' + data
+
+
+def build_tiff(exif_tags, ifd0_tags=None):
+    ifd0_tags = ifd0_tags or {}
+    size = len(build_ifd(ifd0_tags, 8, 0))
+    return b'MM\x00\x2a' + struct.pack('>I', 8) + \
+        build_ifd(ifd0_tags, 8, 8 + size) + build_ifd(exif_tags, 8 + size)
+
+
+def build_jpeg(tiff, xmp=False):
+    exif = b'Exif\x00\x00' + tiff
+    jpeg = b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+    if xmp:
+        packet = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta/>'
+        jpeg += b'\xff\xe1' + struct.pack('>H', len(packet) + 2) + packet
+    return jpeg + b'\xff\xda\x00\x02' + b'\x00' * 16 + b'\xff\xd9'
+
+
+def box(kind, payload):
+    return struct.pack('>I', len(payload) + 8) + kind + payload
+
+
+def build_mp4(brand, created):
+    mvhd = box(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', created, created) + b'\x00' * 88)
+    return box(b'ftyp', brand + b'\x00\x00\x02\x00' + brand) + \
+        box(b'mdat', b'\x00' * 32) + box(b'moov', mvhd)
+
+
+def build_heic(tiff):
+    exif = struct.pack('>I', 6) + b'Exif\x00\x00' + tiff
+    ftyp = box(b'ftyp', b'heic\x00\x00\x00\x00mif1heic')
+    infe = box(b'infe', b'\x02\x00\x00\x00' + struct.pack('>HH', 1, 0) + b'Exif' + b'\x00')
+    iinf = box(b'iinf', b'\x00\x00\x00\x00' + struct.pack('>H', 1) + infe)
+
+    def meta(offset):
+        locations = struct.pack('>HHHHII', 1, 1, 0, 1, offset, len(exif))
+        iloc = box(b'iloc', b'\x00\x00\x00\x00' + bytes([0x44, 0x00]) + locations)
+        return box(b'meta', b'\x00\x00\x00\x00' + iinf + iloc)
+
+    # The Exif item is stored in the mdat box following the meta box
+    offset = len(ftyp) + len(meta(0)) + 8
+    return ftyp + meta(offset) + box(b'mdat', exif)
+
+
+def write(tmp_path, name, content):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_native_reads_jpeg():
+    data = NativeExif('input/exif.jpg').data()
+    assert data['CreateDate'] == '2017:01:01 01:01:01'
+    assert data['MIMEType'] == 'image/jpeg'
+    assert data['SourceFile'] == 'input/exif.jpg'
+    assert 'FileModifyDate' in data
+
+
+def test_native_reads_jpeg_subseconds_and_offset(tmp_path):
+    path = write(tmp_path, 'subsec.jpg', build_jpeg(build_tiff({
+        0x9003: '2019:10:06 11:02:50',
+        0x9011: '+01:00',
+        0x9291: '575',
+    })))
+    data = NativeExif(path).data()
+    assert data['DateTimeOriginal'] == '2019:10:06 11:02:50'
+    assert data['SubSecTimeOriginal'] == 575
+    assert data['SubSecDateTimeOriginal'] == '2019:10:06 11:02:50.575+01:00'
+    assert 'SubSecCreateDate' not in data
+
+
+def test_native_skips_jpeg_with_xmp(tmp_path):
+    path = write(tmp_path, 'xmp.jpg', build_jpeg(build_tiff({0x9004: '2017:01:01 01:01:01'}), xmp=True))
+    assert NativeExif(path).data() is None
+
+
+def test_native_skips_maker_note_time_zone(tmp_path):
+    tiff = build_tiff({0x9004: '2017:01:01 01:01:01', 0x927C: 'note'}, {0x010F: 'Canon'})
+    assert NativeExif(write(tmp_path, 'canon.jpg', build_jpeg(tiff))).data() is None
+    tiff = build_tiff({0x9004: '2017:01:01 01:01:01', 0x927C: 'note'}, {0x010F: 'Apple'})
+    data = NativeExif(write(tmp_path, 'apple.jpg', build_jpeg(tiff))).data()
+    assert data['CreateDate'] == '2017:01:01 01:01:01'
+    assert 'Make' not in data
+    assert 'MakerNote' not in data
+
+
+def test_native_reads_mp4(tmp_path):
+    # 2017-01-01 01:01:01 in seconds since 1904-01-01
+    path = write(tmp_path, 'video.mp4', build_mp4(b'isom', 3566077261))
+    data = NativeExif(path).data()
+    assert data['CreateDate'] == '2017:01:01 01:01:01'
+    assert data['MIMEType'] == 'video/mp4'
+    path = write(tmp_path, 'video.mov', build_mp4(b'qt  ', 0))
+    data = NativeExif(path).data()
+    assert data['CreateDate'] == '0000:00:00 00:00:00'
+    assert data['MIMEType'] == 'video/quicktime'
+
+
+def test_native_rejects_corrupt_mp4_date(tmp_path):
+    mvhd = box(b'mvhd', b'\x01\x00\x00\x00' + struct.pack('>QQ', 2 ** 63, 2 ** 63) + b'\x00' * 88)
+    content = box(b'ftyp', b'isom\x00\x00\x02\x00isom') + box(b'moov', mvhd)
+    assert NativeExif(write(tmp_path, 'video.mp4', content)).data() is None
+
+
+def test_native_skips_mp4_with_xmp():
+    assert NativeExif('input/exif.mp4').data() is None
+
+
+def test_native_reads_heic(tmp_path):
+    path = write(tmp_path, 'image.heic', build_heic(build_tiff({0x9003: '2017:01:01 01:01:01'})))
+    data = NativeExif(path).data()
+    assert data['DateTimeOriginal'] == '2017:01:01 01:01:01'
+    assert data['MIMEType'] == 'image/heic'
+
+
+def test_native_unknown_format():
+    assert NativeExif('input/other.txt').data() is None
+    assert NativeExif('input/not-existing.jpg').data() is None
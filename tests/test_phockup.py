@@ -7,6 +7,7 @@ from datetime import datetime
 
 import pytest
 
+from src.checkpoint import Checkpoint
 from src.dependency import check_dependencies
 from src.exif import Exif
 from src.phockup import Phockup
@@ -145,6 +146,21 @@ def test_get_file_type(mocker):
     assert not Phockup('in', '.').get_file_type("foo/bar")
 
 
+def test_get_output_dir_creates_once(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    phockup = Phockup('input', 'output')
+    isdir = mocker.spy(os.path, 'isdir')
+    for hour in range(3):
+        date = {'date': datetime(2017, 1, 1, hour, 1, 1), 'subseconds': ''}
+        assert phockup.get_output_dir(date) == os.path.normpath('output/2017/01/01')
+    assert isdir.call_count == 1
+    assert os.path.isdir('output/2017/01/01')
+    assert len(phockup.date_paths) == 1
+    shutil.rmtree('output', ignore_errors=True)
+
+
 def test_get_file_name(mocker):
     mocker.patch.object(Phockup, 'check_directories')
     mocker.patch.object(Phockup, 'walk_directory')
@@ -176,6 +192,41 @@ def test_process_file_with_filename_date(mocker):
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_process_file_with_filename_date_first(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2018:01:01 01:01:01"
+    }
+    phockup = Phockup('input', 'output', date_source_order=['filename', 'exif', 'mtime'])
+    phockup.process_file("input/date_20170101_010101.jpg")
+    Exif.data.assert_not_called()
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    # Without a date in the name the exif data is used
+    phockup.process_file("input/exif.jpg")
+    Exif.data.assert_called_once()
+    assert os.path.isfile("output/2018/01/01/20180101-010101.jpg")
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_date_source_order(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    exif_data = {"CreateDate": "2018:01:01 01:01:01"}
+    filename = "input/date_20170101_010101.jpg"
+    assert Phockup('in', 'out', date_source_order=['exif', 'filename']).get_date(
+        filename, exif_data)['date'] == datetime(2018, 1, 1, 1, 1, 1)
+    assert Phockup('in', 'out', date_source_order=['filename', 'exif']).get_date(
+        filename, exif_data)['date'] == datetime(2017, 1, 1, 1, 1, 1)
+    assert Phockup('in', 'out', date_source_order=['exif']).get_date(filename, {}) is None
+    mtime = datetime.fromtimestamp(os.path.getmtime("input/exif.jpg"))
+    assert Phockup('in', 'out', date_source_order=['filename', 'mtime']).get_date(
+        "input/exif.jpg", exif_data)['date'] == mtime
+
+
 def test_process_link_to_file_with_filename_date(mocker):
     shutil.rmtree('output', ignore_errors=True)
     mocker.patch.object(Phockup, 'check_directories')
@@ -217,6 +268,24 @@ def test_process_image_exif_date(mocker):
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_process_image_native_exif(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    phockup = Phockup('input', 'output', native_exif=True)
+    phockup.process_file("input/exif.jpg")
+    assert os.path.isfile("output/2017/01/01/20170101-010101.jpg")
+    assert not Exif.data.called
+    # No date in the headers, so exiftool is asked
+    phockup.process_file("input/date_20170101_010101.jpg")
+    assert Exif.data.called
+    shutil.rmtree('output', ignore_errors=True)
+
+
 def test_process_image_xmp(mocker):
     shutil.rmtree('output', ignore_errors=True)
     mocker.patch.object(Phockup, 'check_directories')
@@ -397,6 +466,49 @@ def test_process_same_date_different_files_rename(mocker):
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_concurrent_same_name(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    contents = set()
+    for root, dirnames, files in os.walk('input'):
+        for filename in files:
+            # other.txt is not a photo, so it is not read with exiftool
+            if not filename.endswith(('.xmp', '.txt')):
+                with open(os.path.join(root, filename), 'rb') as f:
+                    contents.add(f.read())
+    Phockup('input', 'output', io_workers=4)
+    names = [name for name in os.listdir('output/2017/01/01') if not name.endswith('.xmp')]
+    assert len(names) == len(contents)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_process_dedupe_content(mocker, caplog):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    with open("input/tmp_20170101_010101.jpg", "w") as f:
+        f.write("same")
+    with open("input/tmp_20180101_010101.jpg", "w") as f:
+        f.write("same")
+    phockup = Phockup('input', 'output', dedupe_content=True)
+    phockup.process_file("input/tmp_20170101_010101.jpg")
+    with caplog.at_level(logging.INFO):
+        phockup.process_file("input/tmp_20180101_010101.jpg")
+    assert 'skipped, duplicated file output/2017/01/01/20170101-010101.jpg' in caplog.text
+    assert not os.path.isfile("output/2018/01/01/20180101-010101.jpg")
+    shutil.rmtree('output', ignore_errors=True)
+    os.remove("input/tmp_20170101_010101.jpg")
+    os.remove("input/tmp_20180101_010101.jpg")
+
+
 def test_process_skip_xmp(mocker):
     # Assume no errors == skip XMP file
     mocker.patch.object(Phockup, 'check_directories')
@@ -477,6 +589,98 @@ def test_maxconcurrency_five():
     shutil.rmtree('output', ignore_errors=True)
 
 
+def test_exif_and_io_workers():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', exif_workers=2, io_workers=3)
+    validate_copy_operations()
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_io_workers_use_pipeline(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'process_files', return_value=True)
+    phockup = Phockup('input', 'output', io_workers=3)
+    assert phockup.exif_workers == 1
+    assert phockup.io_workers == 3
+    Phockup.process_files.assert_called_once()
+
+
+def test_auto_concurrency(mocker, caplog):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    with caplog.at_level(logging.INFO):
+        Phockup('input', 'output', auto_concurrency=True)
+    assert os.path.isfile('output/unknown/exif.jpg')
+    assert 'Auto concurrency chose --exif-workers=1 --io-workers=1' in caplog.text
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_scan_directory(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    expected = []
+    for root, dirnames, files in os.walk('input'):
+        expected.append((root, [os.path.join(root, f) for f in sorted(files) if f not in ('.DS_Store', 'Thumbs.db')]))
+    phockup = Phockup('input', 'output')
+    phockup.pbar = mocker.MagicMock(total=0)
+    assert list(phockup.scan_directory()) == expected
+    assert phockup.pbar.total == sum(1 for _, files in expected for f in files if not f.endswith('.xmp'))
+    assert 'input/xmp_ext.xmp' in phockup.sidecars
+    assert [root for root, _ in Phockup('input', 'output', max_depth=0).scan_directory()] == ['input']
+
+
+def test_watch_processes_new_files(mocker):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg"
+    }
+    watcher = mocker.patch('src.phockup.DirectoryWatcher')
+    watcher.return_value.batches.return_value = iter([['input/sub_folder/date_20180101_010101.jpg']])
+    mocker.patch.object(Phockup, 'walk_directory', return_value=True)
+    phockup = Phockup('input', 'output', watch=True)
+    assert phockup.files_processed == 1
+    assert os.path.isfile('output/2018/01/01/20180101-010101.jpg')
+    watcher.return_value.close.assert_called_once()
+    assert not os.path.exists(Checkpoint('output', 'input').path)
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_watch_starts_before_walk(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    watcher = mocker.patch('src.phockup.DirectoryWatcher')
+
+    def walk_directory(self):
+        # Files written while the directory is walked are not missed
+        watcher.assert_called_once_with('input', sys.maxsize)
+        return False
+
+    mocker.patch.object(Phockup, 'walk_directory', walk_directory)
+    Phockup('input', 'output', watch=True)
+    watcher.return_value.batches.assert_not_called()
+    watcher.return_value.close.assert_called_once()
+
+
+def test_exif_batch_size():
+    shutil.rmtree('output', ignore_errors=True)
+    Phockup('input', 'output', exif_batch_size=3, max_concurrency=2)
+    validate_copy_operations()
+    shutil.rmtree('output', ignore_errors=True)
+
+
+def test_get_chunks(mocker):
+    mocker.patch.object(Phockup, 'check_directories')
+    mocker.patch.object(Phockup, 'walk_directory')
+    files = [f'{i}.jpg' for i in range(10)]
+    assert Phockup('in', 'out').get_chunks(files, 4) == [[f] for f in files]
+    phockup = Phockup('in', 'out', exif_batch_size=4)
+    assert phockup.get_chunks(files, 1) == [files[0:4], files[4:8], files[8:10]]
+    assert phockup.get_chunks(files, 5) == [files[i:i + 2] for i in range(0, 10, 2)]
+
+
 def validate_copy_operations(prefix=None, suffix=None):
     dir1 = '/2017/01/01'
     dir2 = '/2017/10/06'
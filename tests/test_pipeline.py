@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+import pytest
+
+from src.pipeline import Pipeline
+
+
+def test_pipeline_runs_all_stages():
+    results = []
+    lock = threading.Lock()
+
+    def split(item):
+        return [item * 10 + i for i in range(3)]
+
+    def collect(item):
+        with lock:
+            results.append(item)
+
+    Pipeline([(split, 2), (collect, 3)]).run(range(20))
+    assert sorted(results) == sorted(i * 10 + j for i in range(20) for j in range(3))
+
+
+def test_pipeline_bounds_queued_items():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    release = threading.Event()
+    started = threading.Event()
+
+    def block(item):
+        started.set()
+        release.wait()
+
+    pipeline = Pipeline([(block, 1)])
+    thread = threading.Thread(target=pipeline.run, args=(items(),))
+    thread.start()
+    started.wait()
+    # One item in progress, one waiting in the producer, the queue is full
+    while len(produced) < Pipeline.QUEUE_SIZE_PER_WORKER + 2:
+        pass
+    time.sleep(0.2)
+    assert len(produced) == Pipeline.QUEUE_SIZE_PER_WORKER + 2
+    release.set()
+    thread.join()
+    assert len(produced) == 100
+
+
+def test_pipeline_raises_stage_errors():
+    def fail(item):
+        if item == 5:
+            raise ValueError('broken')
+        return [item]
+
+    with pytest.raises(ValueError):
+        Pipeline([(fail, 2), (lambda item: None, 2)]).run(range(10))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import json
+import os
+
+import pytest
+
+from src.exif import Exif
+from src.phockup import Phockup
+from src.plan import read_plan
+
+
+@pytest.fixture
+def input_dir(tmp_path, mocker):
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    directory = tmp_path / 'input'
+    directory.mkdir()
+    (directory / 'a.jpg').write_bytes(b'first')
+    (directory / 'a.xmp').write_bytes(b'sidecar')
+    (directory / 'b.jpg').write_bytes(b'second')
+    (directory / 'c.jpg').write_bytes(b'first')
+    return str(directory)
+
+
+def listing(directory):
+    return sorted(os.path.relpath(os.path.join(root, f), directory)
+                  for root, dirnames, files in os.walk(directory) for f in files)
+
+
+def test_plan_and_apply(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    Phockup(input_dir, output, dry_run=True, plan_out=plan)
+    assert not os.path.exists(output)
+
+    header, entries = read_plan(plan)
+    assert header['output_dir'] == output
+    entries = {os.path.basename(e['source']): e for e in entries}
+    assert entries['a.jpg']['action'] == 'copy'
+    assert entries['a.jpg']['date'] == '2017-01-01T01:01:01'
+    assert entries['a.jpg']['sidecars'] == [[os.path.join(input_dir, 'a.xmp'),
+                                             os.path.join(output, '2017/01/01/20170101-010101.xmp')]]
+    assert entries['c.jpg']['action'] == 'skip'
+    assert entries['c.jpg']['reason'] == 'duplicate'
+
+    Exif.data.reset_mock()
+    phockup = Phockup(input_dir, output, apply=plan, max_concurrency=2)
+    Exif.data.assert_not_called()
+    assert phockup.files_copied == 2
+    assert phockup.duplicates_found == 1
+    assert listing(output) == ['2017/01/01/20170101-010101-2.jpg',
+                               '2017/01/01/20170101-010101.jpg',
+                               '2017/01/01/20170101-010101.xmp']
+
+
+def test_apply_skips_changed_files(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    Phockup(input_dir, output, dry_run=True, plan_out=plan, move=True)
+    with open(os.path.join(input_dir, 'b.jpg'), 'ab') as f:
+        f.write(b'changed')
+    phockup = Phockup(input_dir, output, apply=plan)
+    assert phockup.files_moved == 1
+    assert os.path.isfile(os.path.join(input_dir, 'b.jpg'))
+    assert not os.path.exists(os.path.join(input_dir, 'a.jpg'))
+    assert not os.path.exists(os.path.join(input_dir, 'a.xmp'))
+
+
+def test_plan_checks_options(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    with pytest.raises(RuntimeError, match='--dry-run'):
+        Phockup(input_dir, output, plan_out=plan)
+    Phockup(input_dir, output, dry_run=True, plan_out=plan)
+    with pytest.raises(RuntimeError, match='is for'):
+        Phockup(input_dir, str(tmp_path / 'other'), apply=plan)
+    with open(plan, 'w') as f:
+        json.dump({'source': 'a.jpg'}, f)
+    with pytest.raises(RuntimeError, match='not a phockup plan'):
+        Phockup(input_dir, output, apply=plan)
+
+
+def test_plan_deletes_verified_duplicates(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    Phockup(input_dir, output, dry_run=True, plan_out=plan, move=True, movedel=True,
+            skip_unknown=True)
+    header, entries = read_plan(plan)
+    deleted = [e for e in entries if e['action'] == 'delete']
+    assert len(deleted) == 1
+    assert os.path.basename(deleted[0]['source']) == 'c.jpg'
+
+    phockup = Phockup(input_dir, output, apply=plan)
+    assert phockup.files_moved == 2
+    assert phockup.duplicates_found == 1
+    assert listing(input_dir) == []
+
+
+def test_apply_keeps_changed_duplicates(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    Phockup(input_dir, output, dry_run=True, plan_out=plan, move=True, movedel=True,
+            skip_unknown=True)
+    # The file c.jpg duplicates is not moved, so c.jpg must stay
+    with open(os.path.join(input_dir, 'a.jpg'), 'ab') as f:
+        f.write(b'changed')
+    phockup = Phockup(input_dir, output, apply=plan)
+    assert phockup.files_moved == 1
+    assert phockup.duplicates_found == 0
+    assert os.path.isfile(os.path.join(input_dir, 'c.jpg'))
+
+
+def test_unfinished_plan_is_discarded(input_dir, tmp_path, mocker):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    mocker.patch.object(Phockup, 'walk_directory', return_value=False)
+    Phockup(input_dir, output, dry_run=True, plan_out=plan)
+    assert not os.path.exists(plan)
+    assert os.listdir(tmp_path) == ['input']
+
+
+def test_plan_without_trailer_is_rejected(input_dir, tmp_path):
+    output = str(tmp_path / 'output')
+    plan = str(tmp_path / 'plan.jsonl')
+    Phockup(input_dir, output, dry_run=True, plan_out=plan)
+    with open(plan) as f:
+        lines = f.readlines()
+    with open(plan, 'w') as f:
+        f.writelines(lines[:-1])
+    with pytest.raises(RuntimeError, match='incomplete'):
+        Phockup(input_dir, output, apply=plan)
+    with open(plan, 'w') as f:
+        f.writelines(lines[:-2] + lines[-1:])
+    with pytest.raises(RuntimeError, match='entries'):
+        Phockup(input_dir, output, apply=plan)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import threading
+
+from src.exif import Exif
+from src.phockup import Phockup
+from src.stats import Histogram, RunStats
+
+os.chdir(os.path.dirname(__file__))
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(1, 101):
+        histogram.add(i / 1000, size=10)
+    stats = histogram.as_dict()
+    assert stats['count'] == 100
+    assert stats['bytes'] == 1000
+    assert stats['max'] == 0.1
+    assert 0.05 <= stats['p50'] <= 0.05 * 1.05
+    assert 0.095 <= stats['p95'] <= 0.095 * 1.05
+    assert 0.099 <= stats['p99'] <= 0.1
+    assert Histogram().as_dict()['p50'] == 0.0
+
+
+def test_run_stats_counts_across_threads():
+    stats = RunStats(timing=True)
+
+    def work():
+        for _ in range(1000):
+            stats.increment('files_copied')
+            with stats.timer('copy', 1):
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.get('files_copied') == 8000
+    assert stats.as_dict()['stages']['copy']['count'] == 8000
+    assert stats.as_dict()['stages']['copy']['bytes'] == 8000
+
+
+def test_run_stats_without_timing():
+    stats = RunStats()
+    with stats.timer('copy'):
+        pass
+    assert stats.as_dict()['stages'] == {}
+
+
+def test_stats_json(mocker, tmp_path):
+    shutil.rmtree('output', ignore_errors=True)
+    mocker.patch.object(Exif, 'data')
+    Exif.data.return_value = {
+        "MIMEType": "image/jpeg",
+        "CreateDate": "2017:01:01 01:01:01"
+    }
+    path = str(tmp_path / 'stats.json')
+    phockup = Phockup('input', 'output', stats_json=path)
+    with open(path) as f:
+        stats = json.load(f)
+    assert stats['counters']['files_processed'] == phockup.files_processed
+    assert stats['counters']['files_copied'] == phockup.files_copied
+    assert stats['stages']['classify']['count'] == phockup.files_processed
+    # other.txt is not read with exiftool
+    assert stats['stages']['exif']['count'] == phockup.files_processed - 1
+    assert stats['stages']['copy']['bytes'] > 0
+    shutil.rmtree('output', ignore_errors=True)
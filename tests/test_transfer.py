@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import errno
+import os
+
+import pytest
+
+from src.transfer import COPY_METHODS, TEMP_SUFFIX, FileCopier, FileMover
+
+
+def write(tmp_path, name, content):
+    path = str(tmp_path / name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    os.utime(path, (1000000000, 1000000000))
+    return path
+
+
+@pytest.mark.parametrize('method', COPY_METHODS)
+def test_copier_copies_content_and_metadata(tmp_path, method):
+    content = os.urandom(200 * 1024)
+    src = write(tmp_path, 'src.jpg', content)
+    dst = str(tmp_path / 'dst.jpg')
+    FileCopier(method).copy(src, dst)
+    with open(dst, 'rb') as f:
+        assert f.read() == content
+    assert os.stat(dst).st_mtime == 1000000000
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(TEMP_SUFFIX)]
+
+
+def test_copier_falls_back(tmp_path, mocker):
+    src = write(tmp_path, 'src.jpg', b'content')
+    copier = FileCopier('auto')
+    mocker.patch.dict(FileCopier.METHODS, {
+        'reflink': mocker.Mock(side_effect=OSError(errno.EOPNOTSUPP, 'not supported')),
+        'copy_file_range': mocker.Mock(side_effect=OSError(errno.EXDEV, 'cross device')),
+    })
+    copier.copy(src, str(tmp_path / 'first.jpg'))
+    copier.copy(src, str(tmp_path / 'second.jpg'))
+    with open(str(tmp_path / 'second.jpg'), 'rb') as f:
+        assert f.read() == b'content'
+    # Unsupported methods are not tried again on the same filesystems
+    assert FileCopier.METHODS['reflink'].call_count == 1
+    assert FileCopier.METHODS['copy_file_range'].call_count == 1
+
+
+def test_copier_raises_other_errors(tmp_path, mocker):
+    src = write(tmp_path, 'src.jpg', b'content')
+    mocker.patch.dict(FileCopier.METHODS, {
+        'reflink': mocker.Mock(side_effect=OSError(errno.ENOSPC, 'no space')),
+    })
+    with pytest.raises(OSError):
+        FileCopier('auto').copy(src, str(tmp_path / 'dst.jpg'))
+    with pytest.raises(FileNotFoundError):
+        FileCopier('auto').copy(str(tmp_path / 'missing.jpg'), str(tmp_path / 'dst.jpg'))
+
+
+def test_mover_verifies_cross_device_move(tmp_path, mocker):
+    content = os.urandom(100 * 1024)
+    src = write(tmp_path, 'src.jpg', content)
+    dst = str(tmp_path / 'dst.jpg')
+    mocker.patch.object(FileMover, 'same_device', return_value=False)
+    mocker.patch.object(FileMover, 'CHUNK_SIZE', 16 * 1024)
+    copy_chunk = mocker.spy(FileMover, 'copy_chunk')
+    mover = FileMover(3)
+    mover.move(src, dst)
+    mover.close()
+    assert not os.path.exists(src)
+    with open(dst, 'rb') as f:
+        assert f.read() == content
+    assert os.stat(dst).st_mtime == 1000000000
+    assert copy_chunk.call_count == 7
+
+
+def test_mover_reads_back_from_disk(tmp_path, mocker):
+    src = write(tmp_path, 'src.jpg', b'content')
+    dst = str(tmp_path / 'dst.jpg')
+    mocker.patch.object(FileMover, 'same_device', return_value=False)
+    drop_cache = mocker.patch('src.transfer.drop_cache', return_value=True)
+    fsync_directory = mocker.patch('src.transfer.fsync_directory')
+    hash_chunk = mocker.spy(FileMover, 'hash_chunk')
+
+    def remove(path):
+        # The copy is verified and its rename synced before the source goes
+        assert drop_cache.call_count == 1
+        assert hash_chunk.call_count == 1
+        fsync_directory.assert_called_once_with(str(tmp_path))
+        os.unlink(path)
+
+    mocker.patch('src.transfer.os.remove', side_effect=remove)
+    FileMover().move(src, dst)
+    assert not os.path.exists(src)
+
+
+def test_mover_keeps_source_on_mismatch(tmp_path, mocker):
+    src = write(tmp_path, 'src.jpg', b'content')
+    dst = str(tmp_path / 'dst.jpg')
+    mocker.patch.object(FileMover, 'same_device', return_value=False)
+    mocker.patch.object(FileMover, 'hash_chunk', return_value=b'corrupt')
+    with pytest.raises(OSError):
+        FileMover().move(src, dst)
+    assert os.path.isfile(src)
+    assert not os.path.exists(dst)
+
+
+def test_mover_renames_on_same_device(tmp_path, mocker):
+    src = write(tmp_path, 'src.jpg', b'content')
+    dst = str(tmp_path / 'dst.jpg')
+    copy_verified = mocker.spy(FileMover, 'copy_verified')
+    FileMover().move(src, dst)
+    assert os.path.isfile(dst)
+    assert copy_verified.call_count == 0
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+import pytest
+
+from src.watch import DirectoryWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='requires inotify')
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_watcher_returns_settled_files(tmp_path):
+    existing = str(tmp_path / 'existing.jpg')
+    write(existing, 'a')
+    watcher = DirectoryWatcher(str(tmp_path), settle_time=0.1)
+    try:
+        write(str(tmp_path / 'new.jpg'), 'b')
+        os.mkdir(str(tmp_path / 'sub'))
+        watcher.read_events(1)
+        write(str(tmp_path / 'sub' / 'nested.jpg'), 'c')
+        found = []
+        batches = watcher.batches()
+        while len(found) < 2:
+            found += next(batches)
+        assert sorted(found) == [str(tmp_path / 'new.jpg'), str(tmp_path / 'sub' / 'nested.jpg')]
+    finally:
+        watcher.close()
+
+
+def test_watcher_waits_for_growing_files(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), settle_time=0.3)
+    try:
+        path = str(tmp_path / 'video.mp4')
+        write(path, 'a')
+        watcher.read_events(1)
+        assert watcher.settled() == []
+        write(path, 'ab')
+        assert watcher.settled() == []
+        assert next(watcher.batches()) == [path]
+    finally:
+        watcher.close()
+
+
+def test_watcher_respects_depth(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), stop_depth=str(tmp_path).count(os.sep), settle_time=0)
+    try:
+        os.mkdir(str(tmp_path / 'sub'))
+        watcher.read_events(1)
+        write(str(tmp_path / 'sub' / 'nested.jpg'), 'c')
+        write(str(tmp_path / 'top.jpg'), 'c')
+        assert next(watcher.batches()) == [str(tmp_path / 'top.jpg')]
+    finally:
+        watcher.close()
+
+
+def test_watcher_does_not_look_up_libc(tmp_path, mocker):
+    # find_library finds nothing on musl systems such as Alpine
+    mocker.patch('ctypes.util.find_library', return_value=None)
+    watcher = DirectoryWatcher(str(tmp_path), settle_time=0)
+    try:
+        write(str(tmp_path / 'new.jpg'), 'new')
+        assert next(watcher.batches()) == [str(tmp_path / 'new.jpg')]
+    finally:
+        watcher.close()